@@ -1,64 +1,144 @@
 # backend/app.py
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context, send_file
 from flask_cors import CORS
 import os
 from threading import Lock
 import threading
 import time
 import random
-from bot_core import EitaaBot, convert_phone_number_format
+import json
+import uuid
+import csv
+import io
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from bot_core import EitaaBot, check_session_file, convert_phone_number_format, extract_usernames_from_text, normalize_username, read_contacts_from_dataframe
+from message_template import MessageTemplate
+from artifacts import ArtifactManager
+from resources import ResourceSampler
+from metrics import REGISTRY, Counter, Gauge, SENDS, SEND_SECONDS, DB_WRITE_SECONDS
+from events import ProgressBroker, LogRing, LogEvent, LogPipeline, LEVEL_NAMES, level_value, format_sse
+from settings_service import SettingsService, DEFAULT_SETTINGS, serialize_setting
+from collections import deque
 import sqlite3
 from werkzeug.utils import secure_filename
-from queue import Queue
-from datetime import datetime
+from queue import Empty
+from datetime import datetime, timedelta
 import pandas as pd
 
 app = Flask(__name__, template_folder='../frontend', static_folder='../frontend')
 CORS(app)
 
 app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['SERVER_PORT'] = 5000
 app.config['SESSION_FOLDER'] = 'sessions'
 app.config['BOT_INSTANCES'] = {}
 app.config['SEND_STATS'] = {}
+app.config['PROGRESS_BROKERS'] = {}
 app.config['CONTACTS'] = []
+app.config['CONTACTS_COUNT'] = {}  # کش تعداد مخاطبین به تفکیک منبع (None = همه)
+app.config['SUPPRESSED'] = None  # مجموعه حافظه نام‌های کاربری لیست عدم ارسال
 app.config['REPORTS'] = []
-app.config['SETTINGS'] = {
-    'default_message': 'سلام [نام] عزیز،\nاین پیام از طرف [سازمان] است.\nبا تشکر',
-    'default_min_delay': 2.0,
-    'default_max_delay': 5.0,
-    'max_per_hour': 100
-}
+app.config['REPORT_SUMMARY'] = None  # کش خلاصه کل گزارش‌ها (از جدول report_totals)
+app.config['SETTINGS'] = SettingsService('eitaa_bot.db')
+# صف محدود مشترک لاگ ربات‌ها؛ سطح از تنظیم log_level (رویدادهای debug در حالت عادی دور ریخته می‌شوند)
+app.config['LOG_PIPELINE'] = LogPipeline('eitaa_bot.db', min_level=app.config['SETTINGS'].get('log_level'))
+app.config['ARTIFACTS'] = ArtifactManager('eitaa_bot.db', root='artifacts')  # اسکرین‌شات‌های خطا
+app.config['IDLE_STATS'] = {'reaped': 0, 'reopened': 0}  # مرورگرهای بسته‌شده بر اثر بیکاری و بازشده دوباره
+app.config['IDLE_REAPER'] = None
+app.config['RESOURCES'] = ResourceSampler(interval=10.0)  # حافظه و CPU سرور و مرورگر هر ربات
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['SESSION_FOLDER'], exist_ok=True)
 
+app_start_time = time.time()
+
 def init_db():
     conn = sqlite3.connect('eitaa_bot.db')
     cursor = conn.cursor()
     
     # ایجاد جداول
-    cursor.execute('''CREATE TABLE IF NOT EXISTS logs 
-                     (id INTEGER PRIMARY KEY, bot_id TEXT, message TEXT, timestamp DATETIME)''')
+    # رویدادهای لاگ ساختاریافته (level عددی: 10 debug، 20 info، 30 warning، 40 error)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS events 
+                     (id INTEGER PRIMARY KEY, ts REAL, level INTEGER, bot_id TEXT, campaign_id TEXT,
+                      step TEXT, username TEXT, duration_ms INTEGER, message TEXT)''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_bot ON events (bot_id, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_campaign ON events (campaign_id, id)')
     cursor.execute('''CREATE TABLE IF NOT EXISTS contacts 
                      (id INTEGER PRIMARY KEY, user_id TEXT, source TEXT, added_date DATETIME)''')
     cursor.execute('''CREATE TABLE IF NOT EXISTS reports 
                      (id INTEGER PRIMARY KEY, date TEXT, total INTEGER, success INTEGER, errors INTEGER, duration TEXT)''')
     cursor.execute('''CREATE TABLE IF NOT EXISTS settings 
                      (id INTEGER PRIMARY KEY, key TEXT UNIQUE, value TEXT)''')
+    # جمع‌های تجمعی گزارش‌ها که در save_report به‌روز می‌شوند (scope: all / day / bot)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS report_totals 
+                     (scope TEXT, key TEXT, campaigns INTEGER, total INTEGER, success INTEGER, errors INTEGER,
+                      PRIMARY KEY (scope, key))''')
     
-    # افزودن تنظیمات پیش‌فرض
-    default_settings = [
-        ('default_message', 'سلام [نام] عزیز،\nاین پیام از طرف [سازمان] است.\nبا تشکر'),
-        ('default_min_delay', '2.0'),
-        ('default_max_delay', '5.0'),
-        ('max_per_hour', '100')
-    ]
+    # لیست عدم ارسال (کاربرانی که نمی‌خواهند پیام دریافت کنند)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS suppressions 
+                     (user_id TEXT PRIMARY KEY, reason TEXT, added_date DATETIME)''')
+    
+    # نتیجه ارسال به هر گیرنده در هر کمپین
+    cursor.execute('''CREATE TABLE IF NOT EXISTS send_results 
+                     (id INTEGER PRIMARY KEY, campaign_id TEXT, bot_id TEXT, username TEXT, outcome TEXT, timestamp DATETIME)''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_send_results_campaign ON send_results (campaign_id)')
+    # تاریخچه ارسال برای جلوگیری از پیام تکراری بین کمپین‌ها
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_send_results_username ON send_results (username, timestamp)')
+    
+    # ایندکس‌های جستجو و صفحه‌بندی مخاطبین
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_contacts_user_id ON contacts (user_id)')
+    # جستجوی پیشوندی بدون حساسیت به حروف بزرگ و کوچک
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_contacts_user_id_nocase ON contacts (user_id COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_contacts_source_id ON contacts (source, id)')
+    
+    # ستون‌های جدید برای دیتابیس‌های قدیمی
+    # اسکرین‌شات‌های خطا (فایل‌ها در پوشه artifacts/<bot_id>/<campaign_id>/)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS artifacts 
+                     (id INTEGER PRIMARY KEY, bot_id TEXT, campaign_id TEXT, error_class TEXT, username TEXT,
+                      path TEXT, size INTEGER, created_at DATETIME)''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_artifacts_bot ON artifacts (bot_id, id)')
+    
+    # ربات‌های ساخته‌شده؛ پس از راه‌اندازی دوباره سرور از همین جدول بازسازی می‌شوند
+    cursor.execute('''CREATE TABLE IF NOT EXISTS bots 
+                     (id TEXT PRIMARY KEY, session_file TEXT, min_delay REAL, max_delay REAL, options TEXT,
+                      created_at DATETIME, last_seen DATETIME)''')
+    
+    ensure_columns(cursor, 'contacts', [('fields', 'TEXT')])  # ستون‌های اضافه مخاطب (JSON) برای قالب پیام
+    ensure_columns(cursor, 'send_results', [('confirm_ms', 'INTEGER')])  # زمان تأیید حباب پیام
+    ensure_columns(cursor, 'reports', [
+        ('bot_id', 'TEXT'),
+        ('campaign_id', 'TEXT'),
+        ('started_at', 'TEXT'),
+        ('finished_at', 'TEXT'),
+        ('duration_seconds', 'REAL'),
+        ('messages_per_minute', 'REAL'),
+        ('pacing_seconds', 'REAL'),
+        ('browser_seconds', 'REAL'),
+        ('outcomes', 'TEXT')
+    ])
     
-    for key, value in default_settings:
-        cursor.execute('INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)', (key, value))
+    # ساخت جمع‌ها از گزارش‌های موجود (فقط بار اول)
+    cursor.execute("SELECT COUNT(*) FROM report_totals")
+    if cursor.fetchone()[0] == 0:
+        for scope, key_expr in (('all', "'all'"), ('day', 'date'), ('bot', "COALESCE(bot_id, '')")):
+            cursor.execute(f'''INSERT INTO report_totals (scope, key, campaigns, total, success, errors)
+                               SELECT '{scope}', {key_expr}, COUNT(*), SUM(total), SUM(success), SUM(errors)
+                               FROM reports GROUP BY {key_expr}''')
+    
+    # افزودن تنظیمات پیش‌فرض
+    for key, value in DEFAULT_SETTINGS.items():
+        cursor.execute('INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)', (key, serialize_setting(value)))
     
     conn.commit()
     conn.close()
+    
+    app.config['SETTINGS'].invalidate()
+    app.config['LOG_PIPELINE'].set_level(app.config['SETTINGS'].get('log_level'))
+    app.config['LOG_PIPELINE'].start()
+    rehydrate_bots()
+    start_idle_reaper()
+    app.config['RESOURCES'].start()
 
 # ==================== ROUTES ====================
 
@@ -73,27 +153,8 @@ def create_bot():
     """ایجاد ربات جدید"""
     try:
         data = request.json or {}
-        bot_id = f"bot_{int(time.time())}"
-        session_file = f"{app.config['SESSION_FOLDER']}/session_{bot_id}.json"
-        
-        # تنظیمات تاخیر
-        min_delay = float(data.get('min_delay', 2.0))
-        max_delay = float(data.get('max_delay', 5.0))
-        
-        bot = EitaaBot(
-            min_delay=min_delay,
-            max_delay=max_delay,
-            session_file=session_file,
-            headless=False,
-            log_queue=Queue()
-        )
-        
-        app.config['BOT_INSTANCES'][bot_id] = {
-            'bot': bot,
-            'log_queue': bot.log_queue,
-            'created_at': datetime.now(),
-            'lock': Lock()
-        }
+        bot_id = f"bot_{uuid.uuid4().hex[:12]}"
+        register_bot(bot_id, data)
         
         # لاگ
         log_to_db(bot_id, f"ربات {bot_id} ایجاد شد")
@@ -103,6 +164,8 @@ def create_bot():
             'bot_id': bot_id,
             'message': 'ربات با موفقیت ایجاد شد'
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -125,7 +188,10 @@ def bot_login(bot_id):
 
         try:
             phone_converted = convert_phone_number_format(phone)
-            result = bot.login(phone_number=phone_converted)
+            result = run_on_bot(bot_data, bot.login, phone_number=phone_converted)
+            touch_bot(bot_id)
+            if bot.playwright is not None:
+                mark_attached(bot_data)
 
             if "waiting_for_code" in result:
                 log_to_db(bot_id, f"منتظر کد تأیید برای شماره {phone}")
@@ -140,10 +206,10 @@ def bot_login(bot_id):
                     'message': 'قبلاً لاگین شده‌اید'
                 })
             else:
-                log_to_db(bot_id, f"خطا در لاگین: {result}")
+                log_to_db(bot_id, f"خطا در لاگین: {result}", level='error')
                 return jsonify({'error': result}), 500
         except Exception as e:
-            log_to_db(bot_id, f"خطا در لاگین: {str(e)}")
+            log_to_db(bot_id, f"خطا در لاگین: {str(e)}", level='error')
             return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bot/<bot_id>/submit-code', methods=['POST'])
@@ -156,11 +222,13 @@ def submit_code(bot_id):
     bot = bot_data['bot']
     lock = bot_data['lock']
 
-    # اطمینان از مقداردهی اولیه ربات
-    if not bot or not bot.page:
-        return jsonify({'error': 'نمونه ربات به درستی مقداردهی اولیه نشده است. لطفاً دوباره تلاش کنید.'}), 500
-
     with lock:
+        # مرورگر ربات بیکار بسته شده یا بازسازی‌شده هنوز باز نشده است
+        if not bot.page:
+            if ensure_attached(bot_id, bot_data):
+                return jsonify({'status': 'success', 'message': 'قبلاً لاگین شده‌اید'})
+            return jsonify({'error': 'مرورگر ربات باز نیست؛ ابتدا شماره تلفن را دوباره ارسال کنید'}), 409
+
         data = request.json or {}
         code = data.get('code')
 
@@ -168,7 +236,7 @@ def submit_code(bot_id):
             return jsonify({'error': 'کد تایید لازم است'}), 400
 
         try:
-            result = bot.submit_code(code)
+            result = run_on_bot(bot_data, bot.submit_code, code)
             if "login_successful" in result:
                 log_to_db(bot_id, "لاگین موفقیت‌آمیز")
                 return jsonify({
@@ -176,10 +244,10 @@ def submit_code(bot_id):
                     'message': 'لاگین موفقیت‌آمیز'
                 })
             else:
-                log_to_db(bot_id, f"خطا در تأیید کد: {result}")
+                log_to_db(bot_id, f"خطا در تأیید کد: {result}", level='error')
                 return jsonify({'error': result}), 500
         except Exception as e:
-            log_to_db(bot_id, f"خطا در تأیید کد: {str(e)}")
+            log_to_db(bot_id, f"خطا در تأیید کد: {str(e)}", level='error')
             return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bot/<bot_id>/send-test', methods=['POST'])
@@ -193,26 +261,31 @@ def send_test_message(bot_id):
     lock = bot_data['lock']
 
     with lock:
-        if not bot.is_logged_in:
+        if not ensure_attached(bot_id, bot_data):
             return jsonify({'error': 'ابتدا لاگین کنید'}), 403
 
         data = request.json or {}
         username = data.get('username', '@test')
-        message = data.get('message', 'تست ربات ایتا')
+        message = MessageTemplate(data.get('message', 'تست ربات ایتا')).render(
+            data.get('fields'), app.config['SETTINGS'].get('template_variables'), username
+        )
 
         try:
-            success = bot.send_direct_message(username, message)
+            success = run_on_bot(bot_data, bot.send_direct_message, username, message)
+            outcome, confirm_seconds = send_outcome(bot, success)
             if success:
                 log_to_db(bot_id, f"تست ارسال به {username} موفق بود")
                 return jsonify({
                     'status': 'success',
-                    'message': 'پیام تست ارسال شد'
+                    'message': 'پیام تست ارسال شد',
+                    'outcome': outcome,
+                    'confirm_ms': round(confirm_seconds * 1000) if confirm_seconds is not None else None
                 })
             else:
-                log_to_db(bot_id, f"تست ارسال به {username} ناموفق بود")
-                return jsonify({'error': 'ارسال ناموفق'}), 500
+                log_to_db(bot_id, f"تست ارسال به {username} ناموفق بود ({outcome})", level='warning', username=username)
+                return jsonify({'error': 'ارسال ناموفق', 'outcome': outcome}), 500
         except Exception as e:
-            log_to_db(bot_id, f"خطا در تست ارسال: {str(e)}")
+            log_to_db(bot_id, f"خطا در تست ارسال: {str(e)}", level='error')
             return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bot/<bot_id>/status', methods=['GET'])
@@ -223,22 +296,66 @@ def bot_status(bot_id):
     
     bot_data = app.config['BOT_INSTANCES'][bot_id]
     bot = bot_data['bot']
-    lock = bot_data['lock']
+    log_ring = bot_data['log_ring']
 
-    with lock:
-        # جمع‌آوری لاگ‌ها
-        logs = []
-        while not bot_data['log_queue'].empty():
-            logs.append(bot_data['log_queue'].get())
+    # قفل ربات گرفته نمی‌شود تا درخواست وضعیت پشت لاگین یا ارسال طولانی منتظر نماند.
+    # لاگ‌ها از حلقه حافظه خوانده می‌شوند (بدون حذف و بدون دیتابیس)؛
+    # کلاینت با since= آخرین شماره‌ای که دیده را می‌فرستد و با level= سطح حداقل را
+    since = request.args.get('since', type=int)
+    # شماره since کلاینت از حلقه قبلی این ربات است (سرور دوباره راه‌اندازی شده)؛ since خودش از ابتدا می‌خواند
+    last_seq = log_ring.last_seq
+    reset = since is not None and since > last_seq
+    if since is None:
+        entries, truncated = log_ring.tail(10), False
+    else:
+        entries, truncated = log_ring.since(since, limit=500)
+    # بدون خط جدید، شماره کهنه کلاینت (از حلقه قبلی) به آخرین شماره حلقه اصلاح می‌شود
+    next_since = entries[-1]['seq'] if entries else min(since or 0, last_seq)
+    if request.args.get('level'):
+        min_level = level_value(request.args['level'])
+        entries = [entry for entry in entries if level_value(entry['level']) >= min_level]
 
-        # لاگ‌های اخیر از دیتابیس
-        recent_logs = get_recent_logs(bot_id, 10)
+    return jsonify({
+        'is_logged_in': bot.is_logged_in,
+        'suspended': 'suspended_at' in bot_data,
+        'session_age': (datetime.now() - bot_data['created_at']).total_seconds(),
+        'page': {
+            'sends_on_page': bot.sends_on_page,
+            'recycles': bot.recycles,
+            'heap_mb': bot.heap_samples[-1][2] if bot.heap_samples else None
+        },
+        'browser': {
+            'headless': bot.browser_headless,
+            'usage': bot.mode_usage
+        },
+        'logs': [f"[{entry['time']}] {entry['message']}" for entry in entries],
+        'entries': entries,
+        'next_since': next_since,
+        'truncated': truncated,
+        'reset': reset
+    })
 
-        return jsonify({
-            'is_logged_in': bot.is_logged_in,
-            'session_age': (datetime.now() - bot_data['created_at']).total_seconds(),
-            'logs': logs[-5:] + recent_logs[-5:]  # 5 لاگ از هر دو منبع
-        })
+@app.route('/api/bot/<bot_id>/usage', methods=['GET'])
+def bot_usage(bot_id):
+    """مصرف CPU و حافظه مرورگر ربات در حالت فعلی و آخرین نمونه حالت دیگر"""
+    if bot_id not in app.config['BOT_INSTANCES']:
+        return jsonify({'error': 'ربات پیدا نشد'}), 404
+
+    bot_data = app.config['BOT_INSTANCES'][bot_id]
+    bot = bot_data['bot']
+    try:
+        if bot.playwright is None:
+            with bot_data['lock']:
+                ensure_attached(bot_id, bot_data)
+        current = run_on_bot(bot_data, bot.browser_usage)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({
+        'status': 'success',
+        'headless': bot.browser_headless,
+        'current': current,
+        'modes': bot.mode_usage
+    })
 
 @app.route('/api/bot/<bot_id>/close', methods=['POST'])
 def close_bot(bot_id):
@@ -251,18 +368,86 @@ def close_bot(bot_id):
     lock = bot_data['lock']
 
     with lock:
-        bot.close()
+        # بستن executor در میانه کمپین همه گیرنده‌های باقی‌مانده را exception ثبت می‌کرد
+        if not stop_campaign(bot_id):
+            return jsonify({'error': 'ارسال جاری هنوز متوقف نشده است؛ کمی بعد دوباره تلاش کنید'}), 409
+        dispose_bot(bot_id, archive_session=True)
+        log_to_db(bot_id, "ربات بسته شد")
 
-        # حذف از حافظه
-        del app.config['BOT_INSTANCES'][bot_id]
+        return jsonify({'status': 'success', 'message': 'ربات بسته شد'})
 
-        # حذف آمار ارسال
-        if bot_id in app.config['SEND_STATS']:
-            del app.config['SEND_STATS'][bot_id]
+@app.route('/api/sessions', methods=['GET'])
+def get_sessions():
+    """فهرست نشست‌های ذخیره‌شده و اعتبار ظاهری هر کدام"""
+    sessions = list_sessions()
+    return jsonify({
+        'status': 'success',
+        'sessions': sessions,
+        'valid': sum(1 for session in sessions if session['status'] == 'ok')
+    })
 
-        log_to_db(bot_id, "ربات بسته شد")
+@app.route('/api/bot/restore', methods=['POST'])
+def restore_bots():
+    """بازگردانی هم‌زمان ربات‌ها از نشست‌های ذخیره‌شده پس از راه‌اندازی دوباره سرور
 
-        return jsonify({'status': 'success', 'message': 'ربات بسته شد'})
+    نشست‌هایی که بررسی سریع فایل را رد کنند اصلاً مرورگر باز نمی‌کنند. برای بقیه
+    لاگین روی ترد اختصاصی هر ربات هم‌زمان اجرا می‌شود و ربات‌هایی که نشستشان در
+    عمل معتبر نبود بسته می‌شوند.
+    """
+    data = request.json or {}
+    requested = set(data.get('bot_ids') or [])
+    options = data.get('options') or {}
+    started = time.time()
+
+    results = {}
+    pending = {}
+    created = set()  # ربات‌هایی که در همین درخواست ساخته شدند (ربات‌های جدول bots نگه داشته می‌شوند)
+    for session in list_sessions():
+        bot_id = session['bot_id']
+        if requested and bot_id not in requested:
+            continue
+        registered = app.config['BOT_INSTANCES'].get(bot_id)
+        if registered and registered['bot'].playwright is not None:
+            results[bot_id] = {'status': 'already_running'}
+            continue
+        if session['status'] != 'ok':
+            results[bot_id] = {'status': 'skipped', 'session': session['status'], 'detail': session['detail']}
+            continue
+        if registered is None:
+            try:
+                registered = register_bot(bot_id, options)
+            except ValueError as e:
+                # لاگین ربات‌هایی که پیش‌تر فرستاده شده‌اند رها نمی‌شود؛ خطا در نتیجه همین ربات می‌آید
+                results[bot_id] = {'status': 'error', 'detail': str(e)}
+                continue
+            created.add(bot_id)
+        # ارسال مستقیم به executor تا لاگین‌ها هم‌زمان اجرا شوند؛ last_used مثل run_on_bot ثبت می‌شود
+        registered['last_used'] = time.time()
+        pending[bot_id] = registered['executor'].submit(registered['bot'].login)
+
+    for bot_id, future in pending.items():
+        try:
+            result = future.result()
+        except Exception as e:
+            result = f"error: {e}"
+        bot_data = app.config['BOT_INSTANCES'][bot_id]
+        if "already_logged_in" in result:
+            mark_attached(bot_data)
+            touch_bot(bot_id)
+            results[bot_id] = {'status': 'restored'}
+            log_to_db(bot_id, "ربات از نشست ذخیره‌شده بازگردانی شد")
+        else:
+            results[bot_id] = {'status': 'invalid', 'detail': result}
+            log_to_db(bot_id, f"نشست ذخیره‌شده معتبر نبود: {result}", level='warning')
+            if bot_id in created:
+                dispose_bot(bot_id)
+
+    return jsonify({
+        'status': 'success',
+        'results': results,
+        'restored': sum(1 for result in results.values() if result['status'] == 'restored'),
+        'duration': round(time.time() - started, 2)
+    })
 
 # ==================== CONTACTS MANAGEMENT ====================
 
@@ -284,34 +469,16 @@ def upload_contacts():
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         file.save(filepath)
         
-        # خواندن فایل
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(filepath, header=None)
-        else:
-            df = pd.read_excel(filepath, header=None)
-        
-        # استخراج یوزرنیم‌ها
+        # خواندن فایل و استخراج یوزرنیم‌ها به همراه ستون‌های دیگر (نام، سازمان، ...)
         contacts = []
-        usernames = []
-        
-        for col in df.columns:
-            for value in df[col].dropna():
-                val_str = str(value).strip()
-                
-                # استخراج یوزرنیم از متن
-                if '@' in val_str:
-                    # پیدا کردن همه یوزرنیم‌ها
-                    import re
-                    found_usernames = re.findall(r'@[\w\d_]+', val_str)
-                    for username in found_usernames:
-                        if username not in usernames:
-                            usernames.append(username)
-                            contacts.append({
-                                'id': len(contacts) + 1,
-                                'user_id': username,
-                                'source': 'Excel',
-                                'added_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            })
+        for username, fields in read_contacts_file(filepath).items():
+            contacts.append({
+                'id': len(contacts) + 1,
+                'user_id': username,
+                'source': 'Excel',
+                'added_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'fields': fields
+            })
         
         # ذخیره در حافظه
         app.config['CONTACTS'] = contacts
@@ -326,12 +493,14 @@ def upload_contacts():
         # ذخیره مخاطبین جدید
         for contact in contacts:
             cursor.execute(
-                "INSERT INTO contacts (user_id, source, added_date) VALUES (?, ?, ?)",
-                (contact['user_id'], contact['source'], contact['added_date'])
+                "INSERT INTO contacts (user_id, source, added_date, fields) VALUES (?, ?, ?, ?)",
+                (contact['user_id'], contact['source'], contact['added_date'],
+                 json.dumps(contact['fields'], ensure_ascii=False) if contact['fields'] else None)
             )
         
         conn.commit()
         conn.close()
+        app.config['CONTACTS_COUNT'].clear()
         
         return jsonify({
             'status': 'success',
@@ -345,14 +514,45 @@ def upload_contacts():
 
 @app.route('/api/contacts', methods=['GET'])
 def get_contacts():
-    """دریافت لیست مخاطبین"""
+    """دریافت لیست مخاطبین (صفحه‌بندی cursor، جستجوی پیشوندی و فیلتر منبع)"""
     try:
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        cursor_id = request.args.get('cursor', type=int)
+        source = request.args.get('source') or None
+        query = (request.args.get('q') or '').strip()
+        
+        # فیلترها (بدون cursor) هم برای صفحه و هم برای شمارش total استفاده می‌شوند
+        conditions = []
+        params = []
+        if source:
+            conditions.append("source = ?")
+            params.append(source)
+        if query:
+            # جستجوی پیشوندی به صورت بازه NOCASE تا ایندکس idx_contacts_user_id_nocase استفاده شود
+            prefix = normalize_username(query)
+            conditions.append("user_id >= ? COLLATE NOCASE AND user_id < ? COLLATE NOCASE")
+            params.extend([prefix, prefix + chr(0x10FFFF)])
+        page_conditions = conditions + (["id < ?"] if cursor_id else [])
+        page_params = params + ([cursor_id] if cursor_id else [])
+        
+        where = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ''
+        
         conn = sqlite3.connect('eitaa_bot.db')
         cursor = conn.cursor()
         
-        cursor.execute("SELECT * FROM contacts ORDER BY added_date DESC LIMIT 100")
+        cursor.execute(
+            f"SELECT id, user_id, source, added_date FROM contacts {where} ORDER BY id DESC LIMIT ?",
+            page_params + [limit]
+        )
         rows = cursor.fetchall()
         
+        if query:
+            # شمارش جستجو کش نمی‌شود؛ بازه ایندکس‌شده است و فقط ردیف‌های منطبق شمرده می‌شوند
+            cursor.execute(f"SELECT COUNT(*) FROM contacts WHERE {' AND '.join(conditions)}", params)
+            total = cursor.fetchone()[0]
+        else:
+            total = get_contacts_count(source)
+        
         contacts = []
         for row in rows:
             contacts.append({
@@ -367,6 +567,8 @@ def get_contacts():
         return jsonify({
             'status': 'success',
             'count': len(contacts),
+            'total': total,
+            'next_cursor': contacts[-1]['id'] if len(contacts) == limit else None,
             'contacts': contacts
         })
     except Exception as e:
@@ -390,6 +592,7 @@ def delete_contacts():
         
         conn.commit()
         conn.close()
+        app.config['CONTACTS_COUNT'].clear()
         
         return jsonify({
             'status': 'success',
@@ -399,6 +602,178 @@ def delete_contacts():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/contacts/export', methods=['GET'])
+def export_contacts():
+    """خروجی مخاطبین به صورت CSV یا XLSX (جریانی، با حافظه ثابت)"""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'xlsx'):
+        return jsonify({'error': 'فرمت باید csv یا xlsx باشد'}), 400
+    
+    source = request.args.get('source')
+    if source:
+        query, params = "SELECT id, user_id, source, added_date FROM contacts WHERE source = ? ORDER BY id", (source,)
+    else:
+        query, params = "SELECT id, user_id, source, added_date FROM contacts ORDER BY id", ()
+    
+    try:
+        return export_rows('contacts', ['id', 'user_id', 'source', 'added_date'], query, params, export_format)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== SUPPRESSION LIST ====================
+
+@app.route('/api/suppressions', methods=['GET'])
+def get_suppressions():
+    """دریافت لیست عدم ارسال"""
+    try:
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        
+        conn = sqlite3.connect('eitaa_bot.db')
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT user_id, reason, added_date FROM suppressions ORDER BY added_date DESC LIMIT ?",
+            (limit,)
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return jsonify({
+            'status': 'success',
+            'count': len(get_suppressed_set()),
+            'suppressions': [{'user_id': row[0], 'reason': row[1], 'added_date': row[2]} for row in rows]
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/suppressions', methods=['POST'])
+def add_suppressions():
+    """افزودن نام‌های کاربری به لیست عدم ارسال"""
+    data = request.json or {}
+    usernames = data.get('usernames', [])
+    
+    if not usernames:
+        return jsonify({'error': 'نام کاربری ارسال نشده'}), 400
+    
+    try:
+        added = save_suppressions(usernames, data.get('reason', 'manual'))
+        return jsonify({
+            'status': 'success',
+            'added': added,
+            'count': len(get_suppressed_set()),
+            'message': f'{added} کاربر به لیست عدم ارسال اضافه شد'
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/suppressions/upload', methods=['POST'])
+def upload_suppressions():
+    """وارد کردن لیست عدم ارسال از فایل اکسل یا CSV"""
+    if 'file' not in request.files:
+        return jsonify({'error': 'فایل انتخاب نشده'}), 400
+    
+    file = request.files['file']
+    if not file.filename.endswith(('.xlsx', '.xls', '.csv')):
+        return jsonify({'error': 'فقط فایل‌های اکسل و CSV مجاز هستند'}), 400
+    
+    try:
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(file.filename))
+        file.save(filepath)
+        
+        if file.filename.endswith('.csv'):
+            df = pd.read_csv(filepath, header=None)
+        else:
+            df = pd.read_excel(filepath, header=None)
+        
+        usernames = []
+        for col in df.columns:
+            for value in df[col].dropna():
+                usernames.extend(extract_usernames_from_text(str(value)))
+        
+        added = save_suppressions(usernames, request.form.get('reason', 'import'))
+        return jsonify({
+            'status': 'success',
+            'added': added,
+            'count': len(get_suppressed_set()),
+            'message': f'{added} کاربر به لیست عدم ارسال اضافه شد'
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/suppressions', methods=['DELETE'])
+def delete_suppressions():
+    """حذف نام‌های کاربری از لیست عدم ارسال"""
+    data = request.json or {}
+    usernames = [normalize_username(u) for u in data.get('usernames', [])]
+    
+    if not usernames:
+        return jsonify({'error': 'نام کاربری ارسال نشده'}), 400
+    
+    try:
+        conn = sqlite3.connect('eitaa_bot.db')
+        cursor = conn.cursor()
+        cursor.executemany("DELETE FROM suppressions WHERE user_id = ?", [(u,) for u in usernames])
+        conn.commit()
+        conn.close()
+        
+        app.config['SUPPRESSED'] = None
+        
+        return jsonify({'status': 'success', 'count': len(get_suppressed_set())})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/not-found', methods=['GET'])
+def get_not_found():
+    """کاربرانی که جستجویشان حالت «نتیجه‌ای یافت نشد» داده و از کمپین‌ها کنار گذاشته می‌شوند"""
+    try:
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        
+        conn = sqlite3.connect('eitaa_bot.db')
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(DISTINCT username) FROM send_results WHERE outcome = 'not_found'")
+        count = cursor.fetchone()[0]
+        cursor.execute(
+            """SELECT username, MAX(timestamp) FROM send_results WHERE outcome = 'not_found'
+               GROUP BY username ORDER BY MAX(timestamp) DESC LIMIT ?""",
+            (limit,)
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        
+        return jsonify({
+            'status': 'success',
+            'count': count,
+            'users': [{'username': row[0], 'last_seen': row[1]} for row in rows]
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/not-found', methods=['DELETE'])
+def clear_not_found():
+    """پاک کردن سابقه «پیدا نشد» (همه یا usernames) تا در کمپین بعدی دوباره تلاش شوند
+
+    ردیف‌های send_results حذف نمی‌شوند؛ outcome آن‌ها not_found_cleared می‌شود تا گزارش کمپین‌ها بماند.
+    """
+    data = request.json or {}
+    usernames = [normalize_username(u) for u in data.get('usernames', [])]
+    
+    try:
+        conn = sqlite3.connect('eitaa_bot.db')
+        cursor = conn.cursor()
+        if usernames:
+            cursor.executemany(
+                "UPDATE send_results SET outcome = 'not_found_cleared' WHERE outcome = 'not_found' AND username = ?",
+                [(u,) for u in usernames]
+            )
+        else:
+            cursor.execute("UPDATE send_results SET outcome = 'not_found_cleared' WHERE outcome = 'not_found'")
+        cleared = conn.total_changes
+        conn.commit()
+        conn.close()
+        
+        return jsonify({'status': 'success', 'cleared': cleared})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ==================== MESSAGE SENDING ====================
 
 @app.route('/api/bot/<bot_id>/send', methods=['POST'])
@@ -412,7 +787,7 @@ def send_messages(bot_id):
     lock = bot_data['lock']
 
     with lock:
-        if not bot.is_logged_in:
+        if not ensure_attached(bot_id, bot_data):
             return jsonify({'error': 'ربات لاگین نیست'}), 403
 
     data = request.json or {}
@@ -422,20 +797,23 @@ def send_messages(bot_id):
     if not message:
         return jsonify({'error': 'متن پیام ضروری است'}), 400
     
-    # ساخت لیست کاربران
+    # ساخت لیست کاربران (و ستون‌های هر مخاطب برای قالب پیام)
     usernames = []
+    recipient_fields = {}
     
     if send_type == 'excel':
         excel_path = data.get('excel_path', '')
         if excel_path and os.path.exists(excel_path):
-            usernames = bot.read_usernames_from_excel(excel_path)
+            recipient_fields = read_contacts_file(excel_path)
+            usernames = list(recipient_fields)
         else:
             # خواندن از دیتابیس
             conn = sqlite3.connect('eitaa_bot.db')
             cursor = conn.cursor()
-            cursor.execute("SELECT user_id FROM contacts")
+            cursor.execute("SELECT user_id, fields FROM contacts")
             rows = cursor.fetchall()
             usernames = [row[0] for row in rows if row[0].startswith('@')]
+            recipient_fields = {row[0]: json.loads(row[1]) for row in rows if row[1]}
             conn.close()
             
             if not usernames:
@@ -447,7 +825,7 @@ def send_messages(bot_id):
         message_prefix = data.get('message_prefix', '')
         
         if group_name and message_prefix:
-            usernames = bot.extract_mentions_from_group(group_name, message_prefix)
+            usernames = run_on_bot(bot_data, bot.extract_mentions_from_group, group_name, message_prefix)
         else:
             usernames = ['@group_user1', '@group_user2', '@group_user3']
     
@@ -457,14 +835,46 @@ def send_messages(bot_id):
     if not usernames:
         return jsonify({'error': 'هیچ کاربری پیدا نشد'}), 400
     
+    # حذف کاربران لیست عدم ارسال (جستجوی O(1) در مجموعه حافظه)
+    suppressed = get_suppressed_set()
+    recipients = [u for u in usernames if normalize_username(u) not in suppressed]
+    suppressed_count = len(usernames) - len(recipients)
+    usernames = recipients
+    
+    # حذف تکراری‌ها و کسانی که در N روز اخیر پیام موفق گرفته‌اند
+    skip_recent_days = int(data.get('skip_recent_days', app.config['SETTINGS'].get('skip_recent_days')) or 0)
+    usernames, skipped_recent, skipped_not_found = filter_recently_messaged(
+        usernames, skip_recent_days, retry_not_found=bool(data.get('retry_not_found', False))
+    )
+    
+    if not usernames:
+        return jsonify({'error': 'پس از حذف لیست عدم ارسال و پیام‌گرفته‌های اخیر، کاربری باقی نماند'}), 400
+    
+    # قالب پیام یک بار برای کل کمپین کامپایل می‌شود
+    template = MessageTemplate(message)
+    variables = dict(app.config['SETTINGS'].get('template_variables'), **(data.get('variables') or {}))
+    columns = set().union(*recipient_fields.values()) if recipient_fields else set()
+    literal_placeholders = template.unresolved(columns, variables)
+    
     # تنظیمات ارسال
     min_delay = float(data.get('min_delay', bot.min_delay))
     max_delay = float(data.get('max_delay', bot.max_delay))
     bot.min_delay = min_delay
     bot.max_delay = max_delay
+    # حداکثر زمان کل هر ارسال (جستجو تا تأیید)؛ گیرنده‌ای که بیشتر طول بکشد timeout می‌خورد
+    send_budget = float(data.get('send_budget_seconds') or bot.send_budget)
+    # حالت pipeline (اختیاری): پیدا کردن گیرنده بعدی در فاصله بین ارسال‌ها با جستجوی همان صفحه
+    bot.pipeline = bool(data.get('pipeline', False))
+    bot.prefetched.clear()
+    bot.pipeline_stats = dict.fromkeys(bot.pipeline_stats, 0)
+    # سیاست بازیافت صفحه (هر N ارسال یا heap بالاتر از حد)؛ ۰ یعنی غیرفعال
+    bot.recycle_every = int(data.get('recycle_every', bot.recycle_every))
+    bot.heap_limit_mb = float(data.get('heap_limit_mb', bot.heap_limit_mb))
+    recycles_before = bot.recycles
     
     # ذخیره آمار
     app.config['SEND_STATS'][bot_id] = {
+        'campaign_id': uuid.uuid4().hex[:12],
         'total': len(usernames),
         'sent': 0,
         'success': 0,
@@ -472,41 +882,131 @@ def send_messages(bot_id):
         'is_running': True,
         'logs': [],
         'usernames': usernames,
-        'current_index': 0
+        'current_index': 0,
+        'min_delay': min_delay,
+        'max_delay': max_delay,
+        'send_budget_seconds': send_budget,
+        'pipeline': bot.pipeline,
+        # زمان‌سنجی واقعی کمپین
+        'started_at': time.time(),
+        'finished_at': None,
+        'pacing_seconds': 0.0,
+        'browser_seconds': 0.0,
+        'suppressed': suppressed_count,
+        'skipped_recent': skipped_recent,
+        'skipped_not_found': skipped_not_found,
+        'unconfirmed': 0,
+        'confirm_seconds': 0.0,  # جمع زمان تأیید پیام‌های تأییدشده
+        'outcomes': {'success': 0, 'unconfirmed': 0, 'not_sent': 0, 'timeout': 0, 'failed': 0, 'exception': 0,
+                     'not_attempted': 0, 'not_found': 0, 'suppressed': suppressed_count,
+                     'skipped_recent': skipped_recent, 'skipped_not_found': skipped_not_found}
     }
     
     def send_thread():
         stats = app.config['SEND_STATS'][bot_id]
-        stats['logs'].append(f"شروع ارسال به {stats['total']} کاربر")
+        bot.campaign_id = stats['campaign_id']  # اسکرین‌شات‌های خطا زیر پوشه همین کمپین
+        add_send_log(bot_id, stats, f"شروع ارسال به {stats['total']} کاربر")
+        if stats['suppressed']:
+            add_send_log(bot_id, stats, f"🚫 {stats['suppressed']} کاربر لیست عدم ارسال کنار گذاشته شدند")
+        if stats['skipped_recent']:
+            add_send_log(bot_id, stats, f"🔁 {stats['skipped_recent']} کاربر تکراری یا پیام‌گرفته در {skip_recent_days} روز اخیر کنار گذاشته شدند")
+        if stats['skipped_not_found']:
+            add_send_log(bot_id, stats, f"👻 {stats['skipped_not_found']} کاربر که قبلاً در ایتا پیدا نشده بودند کنار گذاشته شدند")
+        sent_times = deque()  # زمان ارسال‌های یک ساعت اخیر برای محدودیت max_per_hour
         
         for i, username in enumerate(stats['usernames']):
             if not stats['is_running']:
-                stats['logs'].append("ارسال توسط کاربر متوقف شد")
+                add_send_log(bot_id, stats, "ارسال توسط کاربر متوقف شد")
                 break
             
+            wait_for_hourly_limit(bot_id, stats, sent_times)
+            if not stats['is_running']:
+                add_send_log(bot_id, stats, "ارسال توسط کاربر متوقف شد")
+                break
+            sent_times.append(time.time())
+            
             # ارسال پیام
+            # زمان انتظار تصادفی داخل send_direct_message جزو pacing حساب می‌شود، بقیه کار مرورگر است
+            call_started = time.time()
+            pacing_before = bot.pacing_seconds
             try:
-                success = bot.send_direct_message(username, message)
+                text = template.render(recipient_fields.get(username), variables, username, columns)
+                success = run_on_bot(bot_data, bot.send_direct_message, username, text, stats['send_budget_seconds'])
                 stats['sent'] = i + 1
                 stats['current_index'] = i
                 
-                if success:
+                outcome, confirm_seconds = send_outcome(bot, success)
+                stats['outcomes'][outcome] = stats['outcomes'].get(outcome, 0) + 1
+                SENDS.inc(bot_id, outcome)
+                if outcome == 'success':
                     stats['success'] += 1
-                    stats['logs'].append(f"✅ پیام به {username} ارسال شد")
+                    if confirm_seconds is not None:
+                        stats['confirm_seconds'] += confirm_seconds
+                    add_send_log(bot_id, stats, f"✅ پیام به {username} ارسال شد")
+                elif outcome == 'unconfirmed':
+                    # ممکن است رسیده باشد؛ نه موفق شمرده می‌شود نه خطا، و دوباره ارسال نمی‌شود
+                    stats['unconfirmed'] += 1
+                    add_send_log(bot_id, stats, f"⚠️ ارسال به {username} تأیید نشد")
+                elif outcome == 'not_found':
+                    # شکست دائمی؛ در کمپین‌های بعدی از صف حذف می‌شود (تا با /api/not-found پاک شود)
+                    stats['error'] += 1
+                    add_send_log(bot_id, stats, f"👻 کاربر {username} در ایتا پیدا نشد")
+                elif outcome == 'search_mismatch':
+                    # نتیجه منطبق به موقع نرسید؛ برخلاف not_found در کمپین بعدی دوباره تلاش می‌شود
+                    stats['error'] += 1
+                    add_send_log(bot_id, stats, f"🔍 نتیجه جستجوی {username} به موقع نرسید")
                 else:
                     stats['error'] += 1
-                    stats['logs'].append(f"❌ خطا در ارسال به {username}")
+                    add_send_log(bot_id, stats, f"❌ خطا در ارسال به {username}")
+                record_send_result(bot_id, stats, username, outcome, confirm_seconds)
+                record_send_timing(bot_id, stats, call_started, bot.pacing_seconds - pacing_before)
+                publish_progress(bot_id, stats)
+                
+                # بازیافت صفحه بین دو گیرنده تا DOM و heap در کمپین‌های طولانی بزرگ نشود
+                if i < len(stats['usernames']) - 1:
+                    try:
+                        if run_on_bot(bot_data, bot.maybe_recycle_page):
+                            add_send_log(bot_id, stats, f"♻️ صفحه مرورگر بازیافت شد (بار {bot.recycles})")
+                    except Exception as e:
+                        add_send_log(bot_id, stats, f"⚠️ بازیافت صفحه ناموفق بود: {e}")
                 
                 # وقفه بین ارسال‌ها
                 if i < len(stats['usernames']) - 1:
-                    time.sleep(random.uniform(min_delay, max_delay))
+                    # تأخیرها از stats خوانده می‌شوند تا تغییر تنظیمات روی کمپین جاری اثر کند
+                    delay = random.uniform(stats['min_delay'], stats['max_delay'])
+                    if stats['pipeline']:
+                        # گیرنده بعدی در همین فاصله با جستجوی همان صفحه پیدا می‌شود؛ طول وقفه تغییر نمی‌کند
+                        run_on_bot(bot_data, bot.pace_with_prefetch, delay, stats['usernames'][i + 1])
+                    else:
+                        time.sleep(delay)
+                    stats['pacing_seconds'] += delay
                     
             except Exception as e:
                 stats['error'] += 1
-                stats['logs'].append(f"❌ خطای سیستمی: {str(e)}")
+                stats['outcomes']['exception'] += 1
+                SENDS.inc(bot_id, 'exception')
+                record_send_result(bot_id, stats, username, 'exception')
+                record_send_timing(bot_id, stats, call_started, bot.pacing_seconds - pacing_before)
+                add_send_log(bot_id, stats, f"❌ خطای سیستمی: {str(e)}")
+                publish_progress(bot_id, stats)
         
         stats['is_running'] = False
-        stats['logs'].append("ارسال کامل شد")
+        stats['finished_at'] = time.time()
+        bot.campaign_id = None
+        # نمونه‌های heap صفحه در طول همین کمپین
+        stats['heap_samples'] = [sample for sample in bot.heap_samples if sample[0] >= stats['started_at']]
+        stats['page_recycles'] = bot.recycles - recycles_before
+        try:
+            stats['browser_usage'] = run_on_bot(bot_data, bot.browser_usage)
+        except Exception:
+            stats['browser_usage'] = None
+        if stats['pipeline']:
+            stats['pipeline_stats'] = dict(bot.pipeline_stats)
+            add_send_log(bot_id, stats, f"⚡ pipeline: {bot.pipeline_stats['hits']} گفتگو بدون جستجو باز شد، "
+                                        f"{bot.pipeline_stats['fallbacks']} بار برگشت به جستجو")
+        stats['outcomes']['not_attempted'] = stats['total'] - stats['sent']
+        add_send_log(bot_id, stats, "ارسال کامل شد")
+        get_progress_broker(bot_id).publish('done', progress_snapshot(stats))
         
         # ذخیره گزارش
         save_report(bot_id, stats)
@@ -515,6 +1015,7 @@ def send_messages(bot_id):
     thread = threading.Thread(target=send_thread)
     thread.daemon = True
     thread.start()
+    bot_data['send_thread'] = thread  # برای انتظار stop_campaign پیش از بستن ربات
     
     log_to_db(bot_id, f"شروع ارسال {len(usernames)} پیام")
     
@@ -522,6 +1023,12 @@ def send_messages(bot_id):
         'status': 'started',
         'total': len(usernames),
         'bot_id': bot_id,
+        'campaign_id': app.config['SEND_STATS'][bot_id]['campaign_id'],
+        'suppressed': suppressed_count,
+        'skipped_recent': skipped_recent,
+        'skipped_not_found': skipped_not_found,
+        # [...]هایی که نه ستون فایل‌اند نه متغیر و بدون تغییر در پیام می‌مانند
+        'literal_placeholders': literal_placeholders,
         'message': f'ارسال به {len(usernames)} کاربر شروع شد'
     })
 
@@ -541,6 +1048,50 @@ def send_status(bot_id):
     stats = app.config['SEND_STATS'][bot_id]
     return jsonify(stats)
 
+@app.route('/api/bot/<bot_id>/send/stream', methods=['GET'])
+def send_stream(bot_id):
+    """جریان SSE رویدادهای پیشرفت ارسال (جایگزین polling)"""
+    if bot_id not in app.config['BOT_INSTANCES']:
+        return jsonify({'error': 'ربات پیدا نشد'}), 404
+    
+    subscriber = get_progress_broker(bot_id).subscribe()
+    
+    def generate():
+        try:
+            # وضعیت فعلی برای کلاینتی که تازه وصل شده
+            stats = app.config['SEND_STATS'].get(bot_id)
+            yield format_sse('snapshot', progress_snapshot(stats, with_logs=True))
+            if not stats or not stats['is_running']:
+                return
+            
+            while True:
+                try:
+                    event, data = subscriber.get(timeout=15)
+                except Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                
+                if subscriber.lagged:
+                    # کلاینت عقب مانده؛ به جای رویدادهای از دست رفته یک snapshot کامل
+                    subscriber.drain()
+                    stats = app.config['SEND_STATS'].get(bot_id)
+                    yield format_sse('snapshot', progress_snapshot(stats, with_logs=True))
+                    if not stats or not stats['is_running']:
+                        return
+                    continue
+                
+                yield format_sse(event, data)
+                if event == 'done':
+                    return
+        finally:
+            get_progress_broker(bot_id).unsubscribe(subscriber)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/bot/<bot_id>/send/stop', methods=['POST'])
 def stop_sending(bot_id):
     """توقف ارسال جاری"""
@@ -567,12 +1118,26 @@ def stop_sending(bot_id):
 
 @app.route('/api/reports', methods=['GET'])
 def get_reports():
-    """دریافت گزارش‌ها"""
+    """دریافت گزارش‌ها (صفحه‌بندی با before_id)"""
     try:
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        before_id = request.args.get('before_id', type=int)
+        
         conn = sqlite3.connect('eitaa_bot.db')
         cursor = conn.cursor()
         
-        cursor.execute("SELECT * FROM reports ORDER BY date DESC LIMIT 50")
+        columns = """id, date, total, success, errors, duration, bot_id, campaign_id, started_at, finished_at,
+                     duration_seconds, messages_per_minute, pacing_seconds, browser_seconds, outcomes"""
+        if before_id:
+            cursor.execute(
+                f"SELECT {columns} FROM reports WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (before_id, limit)
+            )
+        else:
+            cursor.execute(
+                f"SELECT {columns} FROM reports ORDER BY id DESC LIMIT ?",
+                (limit,)
+            )
         rows = cursor.fetchall()
         
         reports = []
@@ -583,63 +1148,181 @@ def get_reports():
                 'total': row[2],
                 'success': row[3],
                 'errors': row[4],
-                'duration': row[5]
+                'duration': row[5],
+                'bot_id': row[6],
+                'campaign_id': row[7],
+                'started_at': row[8],
+                'finished_at': row[9],
+                'duration_seconds': row[10],
+                'messages_per_minute': row[11],
+                'pacing_seconds': row[12],
+                'browser_seconds': row[13],
+                'outcomes': json.loads(row[14]) if row[14] else None
             })
         
         conn.close()
         
-        # محاسبه آمار کلی
-        total_messages = sum(r['total'] for r in reports)
-        success_messages = sum(r['success'] for r in reports)
-        error_messages = sum(r['errors'] for r in reports)
-        
         return jsonify({
             'status': 'success',
             'reports': reports,
-            'summary': {
-                'total_messages': total_messages,
-                'success_messages': success_messages,
-                'error_messages': error_messages,
-                'success_rate': (success_messages / total_messages * 100) if total_messages > 0 else 0
-            }
+            'next_before_id': reports[-1]['id'] if len(reports) == limit else None,
+            'summary': get_report_summary()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-# ==================== SETTINGS ====================
-
-@app.route('/api/settings', methods=['GET'])
-def get_settings():
-    """دریافت تنظیمات"""
+@app.route('/api/reports/totals', methods=['GET'])
+def get_report_totals():
+    """جمع گزارش‌ها به تفکیک روز یا ربات"""
+    scope = request.args.get('scope', 'day')
+    if scope not in ('day', 'bot'):
+        return jsonify({'error': 'scope باید day یا bot باشد'}), 400
+    
+    limit = min(max(request.args.get('limit', 30, type=int), 1), 365)
+    
     try:
         conn = sqlite3.connect('eitaa_bot.db')
         cursor = conn.cursor()
-        
-        cursor.execute("SELECT key, value FROM settings")
+        cursor.execute(
+            "SELECT key, campaigns, total, success, errors FROM report_totals WHERE scope = ? ORDER BY key DESC LIMIT ?",
+            (scope, limit)
+        )
         rows = cursor.fetchall()
+        conn.close()
         
-        settings = {}
-        for row in rows:
-            settings[row[0]] = row[1]
+        return jsonify({
+            'status': 'success',
+            'scope': scope,
+            'totals': [
+                {'key': row[0], 'campaigns': row[1], 'total': row[2], 'success': row[3], 'errors': row[4]}
+                for row in rows
+            ]
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reports/<campaign_id>/export', methods=['GET'])
+def export_campaign_results(campaign_id):
+    """خروجی نتیجه ارسال به تک‌تک گیرنده‌های یک کمپین"""
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'xlsx'):
+        return jsonify({'error': 'فرمت باید csv یا xlsx باشد'}), 400
+    
+    try:
+        return export_rows(
+            f'campaign_{secure_filename(campaign_id)}',
+            ['username', 'outcome', 'timestamp', 'bot_id', 'confirm_ms'],
+            "SELECT username, outcome, timestamp, bot_id, confirm_ms FROM send_results WHERE campaign_id = ? ORDER BY id",
+            (campaign_id,),
+            export_format
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== EVENTS ====================
+
+@app.route('/api/events', methods=['GET'])
+def get_events():
+    """رویدادهای لاگ ذخیره‌شده با فیلتر روی فیلدها (جدیدترین اول)"""
+    try:
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        filters, params = [], []
+        for column in ('bot_id', 'campaign_id', 'step', 'username'):
+            if request.args.get(column):
+                filters.append(f"{column} = ?")
+                params.append(request.args[column])
+        if request.args.get('level'):
+            filters.append("level >= ?")
+            params.append(level_value(request.args['level']))
+        before_id = request.args.get('before_id', type=int)
+        if before_id:
+            filters.append("id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ''
         
+        conn = sqlite3.connect('eitaa_bot.db')
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""SELECT id, ts, level, bot_id, campaign_id, step, username, duration_ms, message
+                FROM events {where} ORDER BY id DESC LIMIT ?""",
+            params + [limit]
+        )
+        events = [
+            {'id': row[0], 'time': datetime.fromtimestamp(row[1]).strftime('%Y-%m-%d %H:%M:%S'),
+             'level': LEVEL_NAMES.get(row[2], row[2]), 'bot_id': row[3], 'campaign_id': row[4],
+             'step': row[5], 'username': row[6], 'duration_ms': row[7], 'message': row[8]}
+            for row in cursor.fetchall()
+        ]
         conn.close()
         
-        # تنظیمات پیش‌فرض اگر وجود نداشت
-        defaults = app.config['SETTINGS']
-        for key, value in defaults.items():
-            if key not in settings:
-                settings[key] = value
-        
         return jsonify({
             'status': 'success',
-            'settings': settings
+            'events': events,
+            'next_before_id': events[-1]['id'] if len(events) == limit else None
         })
     except Exception as e:
-        # برگرداندن تنظیمات پیش‌فرض در صورت خطا
+        return jsonify({'error': str(e)}), 500
+
+# ==================== ARTIFACTS ====================
+
+@app.route('/api/artifacts', methods=['GET'])
+def get_artifacts():
+    """فهرست اسکرین‌شات‌های خطا (جدیدترین اول)"""
+    try:
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+        filters, params = [], []
+        for column in ('bot_id', 'campaign_id', 'error_class'):
+            if request.args.get(column):
+                filters.append(f"{column} = ?")
+                params.append(request.args[column])
+        where = f"WHERE {' AND '.join(filters)}" if filters else ''
+        
+        conn = sqlite3.connect('eitaa_bot.db')
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""SELECT id, bot_id, campaign_id, error_class, username, size, created_at
+                FROM artifacts {where} ORDER BY id DESC LIMIT ?""",
+            params + [limit]
+        )
+        artifacts = [
+            {'id': row[0], 'bot_id': row[1], 'campaign_id': row[2], 'error_class': row[3],
+             'username': row[4], 'size': row[5], 'created_at': row[6]}
+            for row in cursor.fetchall()
+        ]
+        conn.close()
+        
         return jsonify({
             'status': 'success',
-            'settings': app.config['SETTINGS']
+            'artifacts': artifacts,
+            'counters': dict(app.config['ARTIFACTS'].counters)
         })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/artifacts/<int:artifact_id>', methods=['GET'])
+def get_artifact_file(artifact_id):
+    """دریافت فایل یک اسکرین‌شات"""
+    conn = sqlite3.connect('eitaa_bot.db')
+    cursor = conn.cursor()
+    cursor.execute("SELECT path FROM artifacts WHERE id = ?", (artifact_id,))
+    row = cursor.fetchone()
+    conn.close()
+    
+    if not row or not os.path.exists(row[0]):
+        return jsonify({'error': 'فایل پیدا نشد'}), 404
+    return send_file(os.path.abspath(row[0]), mimetype='image/jpeg')
+
+# ==================== SETTINGS ====================
+
+@app.route('/api/settings', methods=['GET'])
+def get_settings():
+    """دریافت تنظیمات (از کش حافظه)"""
+    settings = app.config['SETTINGS']
+    return jsonify({
+        'status': 'success',
+        'settings': settings.all(),
+        'version': settings.version
+    })
 
 @app.route('/api/settings', methods=['POST'])
 def save_settings():
@@ -650,30 +1333,78 @@ def save_settings():
         return jsonify({'error': 'داده تنظیمات ارسال نشده'}), 400
     
     try:
-        conn = sqlite3.connect('eitaa_bot.db')
-        cursor = conn.cursor()
-        
-        for key, value in data.items():
-            cursor.execute(
-                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
-                (key, str(value))
-            )
-        
-        conn.commit()
-        conn.close()
-        
-        # آپدیت حافظه
-        for key, value in data.items():
-            app.config['SETTINGS'][key] = value
+        # ذخیره در دیتابیس و کش حافظه؛ کمپین‌های در حال اجرا از طریق شنونده باخبر می‌شوند
+        settings = app.config['SETTINGS'].update(data)
         
         return jsonify({
             'status': 'success',
             'message': 'تنظیمات ذخیره شد',
-            'settings': data
+            'settings': settings,
+            'version': app.config['SETTINGS'].version
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ==================== METRICS ====================
+
+def _bot_resource_values(field, scale=1):
+    """مقدار یک فیلد مصرف منابع هر ربات از آخرین نمونه ResourceSampler"""
+    bots = app.config['RESOURCES'].snapshot().get('bots', {})
+    return {(bot_id,): usage[field] * scale for bot_id, usage in bots.items()}
+
+def _bot_states():
+    states = {('attached',): 0, ('suspended',): 0, ('detached',): 0}
+    for bot_data in list(app.config['BOT_INSTANCES'].values()):
+        if bot_data['bot'].playwright is not None:
+            states[('attached',)] += 1
+        elif 'suspended_at' in bot_data:
+            states[('suspended',)] += 1
+        else:
+            states[('detached',)] += 1
+    return states
+
+def _server_memory():
+    rss_mb = get_memory_usage()
+    return {(): rss_mb * 1024 * 1024} if rss_mb is not None else {}
+
+# متریک‌هایی که هنگام scrape از وضعیت فعلی سرویس خوانده می‌شوند
+REGISTRY.register(Gauge(
+    'eitaa_send_queue_depth', 'Recipients still waiting in running campaigns.', ['bot_id'],
+    collect=lambda: {(bot_id,): stats['total'] - stats['sent']
+                     for bot_id, stats in list(app.config['SEND_STATS'].items()) if stats.get('is_running')}))
+REGISTRY.register(Gauge(
+    'eitaa_log_queue_depth', 'Log events waiting to be written.',
+    collect=lambda: {(): app.config['LOG_PIPELINE'].pending()}))
+REGISTRY.register(Counter(
+    'eitaa_log_events_dropped_total', 'Log events dropped because the log queue was full.',
+    collect=lambda: {(): app.config['LOG_PIPELINE'].dropped}))
+REGISTRY.register(Gauge(
+    'eitaa_artifact_queue_depth', 'Error screenshots waiting to be written.',
+    collect=lambda: {(): app.config['ARTIFACTS'].pending()}))
+REGISTRY.register(Counter(
+    'eitaa_artifacts_total', 'Error screenshot events, by result.', ['result'],
+    collect=lambda: {(result,): count for result, count in app.config['ARTIFACTS'].counters.items()}))
+REGISTRY.register(Gauge(
+    'eitaa_bots', 'Registered bots, by browser state.', ['state'], collect=_bot_states))
+REGISTRY.register(Counter(
+    'eitaa_idle_bots_total', 'Idle browsers closed and reopened.', ['event'],
+    collect=lambda: {(event,): count for event, count in app.config['IDLE_STATS'].items()}))
+REGISTRY.register(Gauge(
+    'eitaa_browser_memory_bytes', 'RSS of each bot browser process tree (last background sample).', ['bot_id'],
+    collect=lambda: _bot_resource_values('rss_mb', 1024 * 1024)))
+REGISTRY.register(Gauge(
+    'eitaa_browser_cpu_percent', 'CPU of each bot browser process tree (last background sample).', ['bot_id'],
+    collect=lambda: _bot_resource_values('cpu_percent')))
+REGISTRY.register(Gauge(
+    'eitaa_server_memory_bytes', 'RSS of the server process (last background sample).', collect=_server_memory))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """متریک‌های سرویس در قالب متنی Prometheus"""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # ==================== SYSTEM STATUS ====================
 
 @app.route('/api/system/status', methods=['GET'])
@@ -683,11 +1414,14 @@ def system_status():
         # وضعیت سرور
         server_status = {
             'running': True,
-            'port': 5000,
+            'port': app.config['SERVER_PORT'],
             'uptime': time.time() - app_start_time,
             'memory_usage': get_memory_usage()
         }
         
+        # مصرف منابع از آخرین نمونه ترد پس‌زمینه (بدون اسکن پروسس‌ها در همین درخواست)
+        resources = app.config['RESOURCES'].snapshot()
+        
         # وضعیت ربات‌ها
         bots_status = []
         for bot_id, bot_data in app.config['BOT_INSTANCES'].items():
@@ -695,9 +1429,12 @@ def system_status():
             bots_status.append({
                 'bot_id': bot_id,
                 'is_logged_in': bot.is_logged_in,
+                'attached': bot.playwright is not None,
+                'suspended': 'suspended_at' in bot_data,
                 'session_age': (datetime.now() - bot_data['created_at']).total_seconds(),
                 'has_active_send': bot_id in app.config['SEND_STATS'] and 
-                                   app.config['SEND_STATS'][bot_id]['is_running']
+                                   app.config['SEND_STATS'][bot_id]['is_running'],
+                'resources': resources.get('bots', {}).get(bot_id)
             })
         
         # وضعیت ذخیره‌سازی
@@ -708,6 +1445,18 @@ def system_status():
             'status': 'success',
             'server': server_status,
             'bots': bots_status,
+            'resources': resources,
+            'artifacts': dict(app.config['ARTIFACTS'].counters),
+            'idle': dict(
+                app.config['IDLE_STATS'],
+                minutes=app.config['SETTINGS'].get('idle_minutes'),
+                suspended=sum(1 for bot_data in app.config['BOT_INSTANCES'].values() if 'suspended_at' in bot_data)
+            ),
+            'logs': {
+                'level': LEVEL_NAMES[app.config['LOG_PIPELINE'].min_level],
+                'pending': app.config['LOG_PIPELINE'].pending(),
+                'dropped': app.config['LOG_PIPELINE'].dropped
+            },
             'storage': {
                 'total_gb': total // (2**30),
                 'used_gb': used // (2**30),
@@ -720,76 +1469,618 @@ def system_status():
 
 # ==================== HELPER FUNCTIONS ====================
 
-def log_to_db(bot_id, message):
-    """ذخیره لاگ در دیتابیس"""
-    try:
+def ensure_columns(cursor, table, columns):
+    """افزودن ستون‌های جدید به جدول در دیتابیس‌هایی که قبلاً ساخته شده‌اند"""
+    existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    for name, column_type in columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+def session_file_path(bot_id):
+    return f"{app.config['SESSION_FOLDER']}/session_{bot_id}.json"
+
+# گزینه‌های ساخت ربات که همراه تأخیرها در جدول bots ذخیره می‌شوند
+BOT_OPTIONS = ('headless', 'headed_login', 'input_strategy')
+
+def register_bot(bot_id, data, created_at=None, persist=True):
+    """ساخت نمونه EitaaBot با ترد مرورگر و حلقه لاگ اختصاصی و افزودن آن به BOT_INSTANCES
+
+    مرورگر اینجا راه‌اندازی نمی‌شود؛ با persist ربات در جدول bots هم ثبت می‌شود.
+    """
+    # تنظیمات تاخیر
+    settings = app.config['SETTINGS']
+    min_delay = float(data.get('min_delay', settings.get('default_min_delay')))
+    max_delay = float(data.get('max_delay', settings.get('default_max_delay')))
+
+    bot = EitaaBot(
+        min_delay=min_delay,
+        max_delay=max_delay,
+        session_file=session_file_path(bot_id),
+        # ارسال‌ها بدون پنجره؛ فقط ورود کد تأیید (وقتی نشستی نیست) در پنجره قابل مشاهده
+        headless=bool(data.get('headless', True)),
+        headed_login=bool(data.get('headed_login', True)),
+        log_queue=app.config['LOG_PIPELINE'],
+        input_strategy=data.get('input_strategy', 'auto'),
+        artifacts=app.config['ARTIFACTS'],
+        bot_id=bot_id
+    )
+    # رویدادهای این ربات از صف مشترک به حلقه لاگ خودش اضافه می‌شوند
+    log_ring = LogRing()
+    app.config['LOG_PIPELINE'].register(bot_id, log_ring)
+    
+    created_at = created_at or datetime.now()
+    if persist:
+        options = {key: data[key] for key in BOT_OPTIONS if key in data}
         conn = sqlite3.connect('eitaa_bot.db')
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO logs (bot_id, message, timestamp) VALUES (?, ?, ?)",
-            (bot_id, message, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        conn.execute(
+            """INSERT OR REPLACE INTO bots (id, session_file, min_delay, max_delay, options, created_at, last_seen)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (bot_id, bot.session_file, min_delay, max_delay, json.dumps(options),
+             created_at.strftime('%Y-%m-%d %H:%M:%S'), created_at.strftime('%Y-%m-%d %H:%M:%S'))
         )
         conn.commit()
         conn.close()
-    except:
-        pass
+    
+    app.config['BOT_INSTANCES'][bot_id] = {
+        'bot': bot,
+        'log_ring': log_ring,
+        'created_at': created_at,
+        'last_used': time.time(),  # زمان آخرین فرمان مرورگر (برای بستن ربات‌های بیکار)
+        'lock': Lock(),
+        # Playwright (sync) فقط از تردی که آن را ساخته قابل استفاده است،
+        # پس همه فرمان‌های مرورگر این ربات روی یک ترد اختصاصی اجرا می‌شوند
+        'executor': ThreadPoolExecutor(max_workers=1, thread_name_prefix=bot_id)
+    }
+    return app.config['BOT_INSTANCES'][bot_id]
 
-def get_recent_logs(bot_id, limit=10):
-    """دریافت لاگ‌های اخیر"""
-    try:
-        conn = sqlite3.connect('eitaa_bot.db')
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT message, timestamp FROM logs WHERE bot_id = ? ORDER BY timestamp DESC LIMIT ?",
-            (bot_id, limit)
-        )
-        rows = cursor.fetchall()
-        conn.close()
-        
-        return [f"[{row[1]}] {row[0]}" for row in rows]
-    except:
-        return []
+def rehydrate_bots():
+    """بازسازی ربات‌های جدول bots در حافظه، بدون راه‌اندازی مرورگر
+
+    هر ربات در اولین استفاده با ensure_attached به فایل نشست خودش وصل می‌شود.
+    """
+    conn = sqlite3.connect('eitaa_bot.db')
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, min_delay, max_delay, options, created_at FROM bots")
+    rows = cursor.fetchall()
+    conn.close()
+
+    for bot_id, min_delay, max_delay, options, created_at in rows:
+        if bot_id in app.config['BOT_INSTANCES']:
+            continue
+        data = dict(json.loads(options or '{}'), min_delay=min_delay, max_delay=max_delay)
+        try:
+            register_bot(bot_id, data, created_at=datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S'), persist=False)
+        except (ValueError, TypeError) as e:
+            print(f"خطا در بازسازی ربات {bot_id}: {e}")
+
+def touch_bot(bot_id):
+    """ثبت زمان آخرین استفاده از ربات در جدول bots"""
+    conn = sqlite3.connect('eitaa_bot.db')
+    conn.execute("UPDATE bots SET last_seen = ? WHERE id = ?",
+                 (datetime.now().strftime('%Y-%m-%d %H:%M:%S'), bot_id))
+    conn.commit()
+    conn.close()
+
+def ensure_attached(bot_id, bot_data):
+    """اتصال تنبل ربات بازسازی‌شده به نشست ذخیره‌شده در اولین استفاده
+
+    اگر مرورگر ربات هنوز راه‌اندازی نشده و فایل نشست بررسی سریع را رد نکند، لاگین
+    (بدون شماره تلفن) روی ترد ربات اجرا می‌شود. خروجی: آیا ربات لاگین است.
+    """
+    bot = bot_data['bot']
+    # فرمانی که بعد از این می‌آید (مثلاً ساخت صف ارسال بیرون از قفل) نباید با بستن ربات بیکار هم‌زمان شود
+    bot_data['last_used'] = time.time()
+    touch_bot(bot_id)
+    if bot.is_logged_in or bot.playwright is not None:
+        return bot.is_logged_in
+    # مرورگری که بر اثر بیکاری بسته شده نشستش را همان لحظه ذخیره کرده است
+    if 'suspended_at' not in bot_data and check_session_file(bot.session_file)[0] != 'ok':
+        return False
+    result = run_on_bot(bot_data, bot.login)
+    if "already_logged_in" in result:
+        mark_attached(bot_data)
+        log_to_db(bot_id, "ربات به نشست ذخیره‌شده متصل شد")
+        return True
+    log_to_db(bot_id, f"اتصال به نشست ذخیره‌شده ناموفق بود: {result}", level='warning')
+    return False
+
+def mark_attached(bot_data):
+    """پاک کردن نشانه تعلیق پس از باز شدن دوباره مرورگر (از هر مسیری)"""
+    bot_data['last_used'] = time.time()
+    if bot_data.pop('suspended_at', None):
+        app.config['IDLE_STATS']['reopened'] += 1
+
+def reap_idle_bots(now=None):
+    """بستن مرورگر ربات‌هایی که بیش از idle_minutes دقیقه فرمانی نگرفته‌اند
+
+    نشست پیش از بستن ذخیره می‌شود و ensure_attached در فرمان بعدی مرورگر را از همان
+    نشست باز می‌کند. ربات در حال ارسال یا ربات با قفل گرفته‌شده کنار گذاشته می‌شود.
+    """
+    minutes = app.config['SETTINGS'].get('idle_minutes')
+    if not minutes:
+        return 0
+    now = now or time.time()
+    reaped = 0
+    for bot_id, bot_data in list(app.config['BOT_INSTANCES'].items()):
+        bot = bot_data['bot']
+        if bot.playwright is None or now - bot_data['last_used'] < minutes * 60:
+            continue
+        stats = app.config['SEND_STATS'].get(bot_id)
+        if stats and stats.get('is_running'):
+            continue
+        lock = bot_data['lock']
+        if not lock.acquire(blocking=False):
+            continue
+        try:
+            if run_on_bot(bot_data, bot.suspend):
+                bot_data['suspended_at'] = now
+                app.config['IDLE_STATS']['reaped'] += 1
+                reaped += 1
+                log_to_db(bot_id, f"مرورگر ربات پس از {minutes} دقیقه بیکاری بسته شد")
+        except Exception as e:
+            log_to_db(bot_id, f"خطا در بستن مرورگر بیکار: {e}", level='warning')
+        finally:
+            lock.release()
+    return reaped
+
+def start_idle_reaper(interval=60):
+    """ترد پس‌زمینه‌ای که هر interval ثانیه ربات‌های بیکار را می‌بندد (فقط یک بار ساخته می‌شود)"""
+    if app.config['IDLE_REAPER'] is not None:
+        return
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                reap_idle_bots()
+            except Exception as e:
+                print(f"خطا در بستن ربات‌های بیکار: {e}")
+
+    app.config['IDLE_REAPER'] = threading.Thread(target=loop, name='idle-reaper', daemon=True)
+    app.config['IDLE_REAPER'].start()
+
+def stop_campaign(bot_id, timeout=None):
+    """توقف کمپین در حال اجرای ربات و انتظار برای پایان ترد ارسال (ذخیره گزارش)
+
+    ارسال جاری تا پایان همان گیرنده و وقفه بعد از آن ادامه پیدا می‌کند؛ پیش‌فرض timeout
+    بودجه یک ارسال به‌علاوه بیشترین وقفه است. خروجی: آیا دیگر ارسالی در جریان نیست.
+    """
+    stats = app.config['SEND_STATS'].get(bot_id)
+    thread = app.config['BOT_INSTANCES'][bot_id].get('send_thread')
+    if stats and stats['is_running']:
+        stats['is_running'] = False
+        log_to_db(bot_id, f"ارسال برای بستن ربات متوقف شد. {stats['sent']} از {stats['total']} ارسال شد.")
+    if thread is None or not thread.is_alive():
+        return True
+    if timeout is None:
+        timeout = (stats['send_budget_seconds'] + stats['max_delay'] + 15) if stats else 60
+    thread.join(timeout)
+    return not thread.is_alive()
+
+def dispose_bot(bot_id, archive_session=False):
+    """بستن مرورگر ربات، حذف همه داده‌های حافظه آن و حذف از جدول bots
+
+    با archive_session فایل نشست به session_<id>.json.closed تغییر نام می‌دهد تا
+    /api/bot/restore رباتی را که کاربر بسته دوباره نسازد (فایل برای بازیابی دستی می‌ماند).
+    """
+    bot_data = app.config['BOT_INSTANCES'][bot_id]
+    run_on_bot(bot_data, bot_data['bot'].close)
+    bot_data['executor'].shutdown(wait=False)
+
+    # حذف از حافظه
+    del app.config['BOT_INSTANCES'][bot_id]
+
+    # حذف آمار ارسال
+    if bot_id in app.config['SEND_STATS']:
+        del app.config['SEND_STATS'][bot_id]
+    app.config['PROGRESS_BROKERS'].pop(bot_id, None)
+    app.config['LOG_PIPELINE'].unregister(bot_id)
+
+    conn = sqlite3.connect('eitaa_bot.db')
+    conn.execute("DELETE FROM bots WHERE id = ?", (bot_id,))
+    conn.commit()
+    conn.close()
+
+    session_file = session_file_path(bot_id)
+    if archive_session and os.path.exists(session_file):
+        os.replace(session_file, session_file + '.closed')
+
+def list_sessions():
+    """فایل‌های نشست ذخیره‌شده با نتیجه بررسی سریع (بدون راه‌اندازی مرورگر)"""
+    sessions = []
+    folder = app.config['SESSION_FOLDER']
+    for name in sorted(os.listdir(folder)):
+        if not (name.startswith('session_') and name.endswith('.json')):
+            continue
+        bot_id = name[len('session_'):-len('.json')]
+        path = os.path.join(folder, name)
+        status, detail = check_session_file(path)
+        sessions.append({
+            'bot_id': bot_id,
+            'status': status,
+            'detail': detail,
+            'modified': datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y-%m-%d %H:%M:%S'),
+            'running': bot_id in app.config['BOT_INSTANCES']
+        })
+    return sessions
+
+def run_on_bot(bot_data, func, *args, **kwargs):
+    """اجرای یک فرمان مرورگر روی ترد اختصاصی ربات و انتظار برای نتیجه"""
+    bot_data['last_used'] = time.time()
+    return bot_data['executor'].submit(func, *args, **kwargs).result()
+
+def get_progress_broker(bot_id):
+    """دریافت (یا ساخت) پخش‌کننده رویدادهای پیشرفت یک ربات"""
+    return app.config['PROGRESS_BROKERS'].setdefault(bot_id, ProgressBroker())
+
+def progress_snapshot(stats, with_logs=False):
+    """شمارنده‌های فعلی ارسال برای ارسال به کلاینت"""
+    if not stats:
+        return {'is_running': False, 'total': 0, 'sent': 0, 'success': 0, 'error': 0, 'logs': []}
+    
+    snapshot = {
+        'is_running': stats['is_running'],
+        'total': stats['total'],
+        'sent': stats['sent'],
+        'success': stats['success'],
+        'error': stats['error'],
+        'unconfirmed': stats['unconfirmed'],
+        'avg_confirm_ms': round(stats['confirm_seconds'] * 1000 / stats['success']) if stats['success'] else None
+    }
+    if with_logs:
+        snapshot['logs'] = stats['logs'][-20:]
+    return snapshot
+
+def publish_progress(bot_id, stats):
+    """انتشار شمارنده‌های جدید برای کلاینت‌های SSE"""
+    get_progress_broker(bot_id).publish('progress', progress_snapshot(stats))
+
+def add_send_log(bot_id, stats, message):
+    """افزودن خط لاگ ارسال و انتشار آن برای کلاینت‌های SSE"""
+    stats['logs'].append(message)
+    get_progress_broker(bot_id).publish('log', {'message': message})
+
+def log_to_db(bot_id, message, level='info', **fields):
+    """ثبت رویداد لاگ از سمت سرور؛ از همان صف ربات‌ها به حلقه لاگ و جدول events می‌رود"""
+    app.config['LOG_PIPELINE'].put(LogEvent(message, level=level, bot_id=bot_id, **fields))
 
 def save_report(bot_id, stats):
     """ذخیره گزارش در دیتابیس"""
     try:
+        write_started = time.perf_counter()
         conn = sqlite3.connect('eitaa_bot.db')
         cursor = conn.cursor()
         
-        duration = "نامشخص"
-        if stats['total'] > 0:
-            estimated = stats['total'] * 3.5 / 60  # میانگین 3.5 ثانیه برای هر پیام
-            duration = f"{estimated:.1f} دقیقه"
+        # مدت واقعی کمپین از زمان شروع تا پایان
+        finished_at = stats['finished_at'] or time.time()
+        duration_seconds = finished_at - stats['started_at']
+        duration = f"{duration_seconds / 60:.1f} دقیقه"
+        messages_per_minute = stats['sent'] / (duration_seconds / 60) if duration_seconds > 0 else 0
         
+        date = datetime.now().strftime('%Y-%m-%d')
         cursor.execute(
-            """INSERT INTO reports (date, total, success, errors, duration) 
-               VALUES (?, ?, ?, ?, ?)""",
-            (datetime.now().strftime('%Y-%m-%d'), 
+            """INSERT INTO reports (date, total, success, errors, duration, bot_id, campaign_id,
+                                   started_at, finished_at, duration_seconds, messages_per_minute,
+                                   pacing_seconds, browser_seconds, outcomes) 
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (date, 
              stats['total'], 
              stats['success'], 
              stats['error'], 
-             duration)
+             duration,
+             bot_id,
+             stats['campaign_id'],
+             datetime.fromtimestamp(stats['started_at']).strftime('%Y-%m-%d %H:%M:%S'),
+             datetime.fromtimestamp(finished_at).strftime('%Y-%m-%d %H:%M:%S'),
+             round(duration_seconds, 2),
+             round(messages_per_minute, 2),
+             round(stats['pacing_seconds'], 2),
+             round(stats['browser_seconds'], 2),
+             json.dumps(stats['outcomes']))
         )
         
+        # به‌روزرسانی جمع‌های تجمعی در همان تراکنش
+        for scope, key in (('all', 'all'), ('day', date), ('bot', bot_id)):
+            cursor.execute(
+                """INSERT INTO report_totals (scope, key, campaigns, total, success, errors)
+                   VALUES (?, ?, 1, ?, ?, ?)
+                   ON CONFLICT (scope, key) DO UPDATE SET
+                       campaigns = campaigns + 1,
+                       total = total + excluded.total,
+                       success = success + excluded.success,
+                       errors = errors + excluded.errors""",
+                (scope, key, stats['total'], stats['success'], stats['error'])
+            )
+        
         conn.commit()
         conn.close()
+        DB_WRITE_SECONDS.observe(time.perf_counter() - write_started, 'reports')
+        
+        # کش خلاصه در اولین درخواست بعدی دوباره خوانده می‌شود
+        app.config['REPORT_SUMMARY'] = None
     except Exception as e:
         print(f"خطا در ذخیره گزارش: {e}")
 
-def get_memory_usage():
-    """دریافت میزان مصرف حافظه"""
+def send_outcome(bot, success):
+    """نتیجه دقیق آخرین send_direct_message: (outcome، زمان تأیید به ثانیه)"""
+    last_send = bot.last_send or {}
+    if success:
+        return 'success', last_send.get('confirm_seconds')
+    # ارسال ناموفق هرگز موفق شمرده نمی‌شود، حتی اگر last_send کهنه مانده باشد
+    outcome = last_send.get('outcome', 'failed')
+    return (outcome if outcome != 'success' else 'failed'), None
+
+def record_send_result(bot_id, stats, username, outcome, confirm_seconds=None):
+    """ثبت نتیجه ارسال به یک گیرنده"""
+    confirm_ms = round(confirm_seconds * 1000) if confirm_seconds is not None else None
     try:
-        import psutil
-        process = psutil.Process(os.getpid())
-        return process.memory_info().rss / 1024 / 1024  # MB
-    except:
-        return 0
+        write_started = time.perf_counter()
+        conn = sqlite3.connect('eitaa_bot.db')
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO send_results (campaign_id, bot_id, username, outcome, timestamp, confirm_ms) VALUES (?, ?, ?, ?, ?, ?)",
+            (stats['campaign_id'], bot_id, normalize_username(username), outcome,
+             datetime.now().strftime('%Y-%m-%d %H:%M:%S'), confirm_ms)
+        )
+        conn.commit()
+        conn.close()
+        DB_WRITE_SECONDS.observe(time.perf_counter() - write_started, 'send_results')
+    except Exception as e:
+        print(f"خطا در ثبت نتیجه ارسال: {e}")
+
+def iter_query(query, params, batch_size=1000):
+    """خواندن دسته‌ای نتیجه کوئری بدون نگه داشتن همه سطرها در حافظه"""
+    conn = sqlite3.connect('eitaa_bot.db')
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+def export_rows(name, header, query, params, export_format):
+    """پاسخ جریانی CSV یا XLSX برای نتیجه یک کوئری"""
+    if export_format == 'xlsx':
+        return export_rows_xlsx(name, header, query, params)
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM برای نمایش درست متن فارسی در اکسل
+        buffer.write('\ufeff')
+        writer.writerow(header)
+        for rows in iter_query(query, params):
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={name}.csv'}
+    )
+
+def export_rows_xlsx(name, header, query, params):
+    """XLSX با حالت write-only؛ سطرها مستقیم روی فایل موقت نوشته و سپس جریانی ارسال می‌شوند"""
+    from openpyxl import Workbook
+    
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(name[:31])
+    sheet.append(header)
+    for rows in iter_query(query, params):
+        for row in rows:
+            sheet.append(row)
+    
+    temp = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False)
+    temp.close()
+    workbook.save(temp.name)
+    
+    def generate():
+        with open(temp.name, 'rb') as f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+    
+    def cleanup():
+        try:
+            os.remove(temp.name)
+        except OSError:
+            pass
+    
+    response = Response(
+        generate(),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={
+            'Content-Disposition': f'attachment; filename={name}.xlsx',
+            'Content-Length': str(os.path.getsize(temp.name))
+        }
+    )
+    # فایل موقت حتی وقتی بدنه خوانده نمی‌شود (HEAD یا قطع اتصال پیش از اولین قطعه) حذف می‌شود
+    response.call_on_close(cleanup)
+    return response
+
+def record_send_timing(bot_id, stats, call_started, pacing_seconds):
+    """تقسیم زمان یک ارسال بین انتظار (pacing) و کار مرورگر"""
+    elapsed = time.time() - call_started
+    browser_seconds = max(elapsed - pacing_seconds, 0.0)
+    stats['pacing_seconds'] += pacing_seconds
+    stats['browser_seconds'] += browser_seconds
+    SEND_SECONDS.observe(browser_seconds, bot_id)
+
+def wait_for_hourly_limit(bot_id, stats, sent_times):
+    """انتظار تا زمانی که ارسال بعدی از max_per_hour (تنظیمات جاری) تجاوز نکند"""
+    announced = False
+    while stats['is_running']:
+        # هر بار از کش خوانده می‌شود تا تغییر تنظیمات بدون ری‌استارت اعمال شود
+        max_per_hour = app.config['SETTINGS'].get('max_per_hour')
+        now = time.time()
+        while sent_times and now - sent_times[0] >= 3600:
+            sent_times.popleft()
+        
+        if not max_per_hour or len(sent_times) < max_per_hour:
+            return
+        
+        if not announced:
+            wait_seconds = 3600 - (now - sent_times[0])
+            add_send_log(bot_id, stats, f"⏳ سقف {max_per_hour} پیام در ساعت؛ توقف حدود {wait_seconds / 60:.1f} دقیقه")
+            announced = True
+        time.sleep(1)
+        stats['pacing_seconds'] += 1
+
+def apply_settings_to_campaigns(changed, version):
+    """اعمال تأخیرهای جدید روی کمپین‌های در حال اجرا"""
+    if 'default_min_delay' not in changed and 'default_max_delay' not in changed:
+        return
+    
+    settings = app.config['SETTINGS'].all()
+    for bot_id, stats in list(app.config['SEND_STATS'].items()):
+        if not stats['is_running']:
+            continue
+        stats['min_delay'] = settings['default_min_delay']
+        stats['max_delay'] = settings['default_max_delay']
+        bot_data = app.config['BOT_INSTANCES'].get(bot_id)
+        if bot_data:
+            bot_data['bot'].min_delay = stats['min_delay']
+            bot_data['bot'].max_delay = stats['max_delay']
+        add_send_log(bot_id, stats, f"⚙️ تنظیمات نسخه {version} اعمال شد: تأخیر {stats['min_delay']} تا {stats['max_delay']} ثانیه")
+
+app.config['SETTINGS'].subscribe(apply_settings_to_campaigns)
+
+def apply_log_level(changed, version):
+    """تغییر سطح لاگ بدون راه‌اندازی مجدد"""
+    if 'log_level' in changed:
+        app.config['LOG_PIPELINE'].set_level(changed['log_level'])
+
+app.config['SETTINGS'].subscribe(apply_log_level)
+
+def read_contacts_file(filepath):
+    """خواندن فایل اکسل یا CSV و برگرداندن username -> ستون‌های دیگر همان سطر"""
+    if filepath.endswith('.csv'):
+        df = pd.read_csv(filepath, header=None)
+    else:
+        df = pd.read_excel(filepath, header=None)
+    return read_contacts_from_dataframe(df)
+
+def get_suppressed_set():
+    """مجموعه حافظه لیست عدم ارسال؛ پس از هر تغییر دوباره از دیتابیس خوانده می‌شود"""
+    suppressed = app.config['SUPPRESSED']
+    if suppressed is None:
+        conn = sqlite3.connect('eitaa_bot.db')
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id FROM suppressions")
+        suppressed = frozenset(row[0] for row in cursor.fetchall())
+        conn.close()
+        app.config['SUPPRESSED'] = suppressed
+    return suppressed
+
+def save_suppressions(usernames, reason):
+    """ذخیره نام‌های کاربری در لیست عدم ارسال؛ تعداد موارد جدید را برمی‌گرداند"""
+    normalized = {normalize_username(u) for u in usernames if str(u).strip()}
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    conn = sqlite3.connect('eitaa_bot.db')
+    cursor = conn.cursor()
+    before = conn.total_changes
+    cursor.executemany(
+        "INSERT OR IGNORE INTO suppressions (user_id, reason, added_date) VALUES (?, ?, ?)",
+        [(u, reason, now) for u in normalized]
+    )
+    added = conn.total_changes - before
+    conn.commit()
+    conn.close()
+    
+    app.config['SUPPRESSED'] = None
+    return added
+
+def filter_recently_messaged(usernames, days, retry_not_found=False):
+    """حذف تکراری‌ها، کاربرانی که قبلاً «پیدا نشد» گرفته‌اند (شکست دائمی، مگر با retry_not_found)
+    و (اگر days > 0) کسانی که در days روز اخیر پیام موفق (یا تأییدنشده) گرفته‌اند
+
+    صف در یک جدول موقت ریخته می‌شود و با یک join روی ایندکس (username, timestamp)
+    تاریخچه ارسال بررسی می‌شود. خروجی: (لیست نهایی، تعداد تکراری/اخیر، تعداد پیدانشده)
+    """
+    unique = {}
+    for username in usernames:
+        unique.setdefault(normalize_username(username), username)
+    
+    recent, not_found = set(), set()
+    if unique:
+        cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S') if days > 0 else None
+        conn = sqlite3.connect('eitaa_bot.db')
+        cursor = conn.cursor()
+        cursor.execute("CREATE TEMP TABLE send_queue (username TEXT PRIMARY KEY)")
+        cursor.executemany("INSERT INTO send_queue (username) VALUES (?)", [(u,) for u in unique])
+        cursor.execute(
+            """SELECT q.username, MAX(r.outcome = 'not_found') FROM send_queue q
+               JOIN send_results r ON r.username = q.username
+               WHERE (r.outcome = 'not_found' AND NOT ?)
+                  OR (r.outcome IN ('success', 'unconfirmed') AND r.timestamp >= ?)
+               GROUP BY q.username""",
+            (retry_not_found, cutoff)
+        )
+        for username, is_not_found in cursor.fetchall():
+            (not_found if is_not_found else recent).add(username)
+        conn.close()
+    
+    filtered = [original for key, original in unique.items() if key not in recent and key not in not_found]
+    return filtered, len(usernames) - len(filtered) - len(not_found), len(not_found)
+
+def get_contacts_count(source=None):
+    """تعداد مخاطبین از کش؛ فقط بعد از آپلود یا حذف دوباره شمرده می‌شود"""
+    counts = app.config['CONTACTS_COUNT']
+    if source not in counts:
+        conn = sqlite3.connect('eitaa_bot.db')
+        cursor = conn.cursor()
+        if source:
+            cursor.execute("SELECT COUNT(*) FROM contacts WHERE source = ?", (source,))
+        else:
+            cursor.execute("SELECT COUNT(*) FROM contacts")
+        counts[source] = cursor.fetchone()[0]
+        conn.close()
+    return counts[source]
+
+def get_report_summary():
+    """خلاصه کل گزارش‌ها از کش یا یک سطر جدول report_totals"""
+    summary = app.config['REPORT_SUMMARY']
+    if summary is not None:
+        return summary
+    
+    conn = sqlite3.connect('eitaa_bot.db')
+    cursor = conn.cursor()
+    cursor.execute("SELECT campaigns, total, success, errors FROM report_totals WHERE scope = 'all' AND key = 'all'")
+    row = cursor.fetchone() or (0, 0, 0, 0)
+    conn.close()
+    
+    campaigns, total_messages, success_messages, error_messages = (value or 0 for value in row)
+    summary = {
+        'campaigns': campaigns,
+        'total_messages': total_messages,
+        'success_messages': success_messages,
+        'error_messages': error_messages,
+        'success_rate': (success_messages / total_messages * 100) if total_messages > 0 else 0
+    }
+    app.config['REPORT_SUMMARY'] = summary
+    return summary
+
+def get_memory_usage():
+    """حافظه پروسس سرور (MB) از آخرین نمونه ResourceSampler؛ بدون psutil یا پیش از اولین نمونه None"""
+    server = app.config['RESOURCES'].snapshot().get('server')
+    return server['rss_mb'] if server else None
 
 # ==================== MAIN ====================
 
 if __name__ == '__main__':
+    # حالت توسعه؛ برای اجرای عملیاتی از backend/serve.py استفاده کنید.
+    # reloader خاموش است: پروسس دوم آن init_db، ربات‌ها و تردهای پس‌زمینه را دوباره می‌ساخت
     init_db()
-    app_start_time = time.time()
     print("🚀 سرور ربات ایتا در حال راه‌اندازی...")
     print("🌐 آدرس دسترسی: http://localhost:5000")
-    app.run(host='0.0.0.0', port=5000, debug=True, threaded=False)
+    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True, use_reloader=False)
@@ -0,0 +1,124 @@
+# backend/artifacts.py - اسکرین‌شات‌های خطا با محدودیت نرخ و ذخیره در پس‌زمینه
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from queue import Queue, Full
+
+
+class ArtifactManager:
+    """مدیریت اسکرین‌شات‌های خطای ربات‌ها
+
+    - برای هر (ربات، نوع خطا) حداکثر max_per_class عکس در هر window_seconds گرفته می‌شود؛
+      بقیه فقط شمرده می‌شوند (throttled).
+    - گرفتن عکس روی ترد مرورگر فقط بایت‌ها را برمی‌دارد؛ نوشتن فایل، ثبت در جدول
+      artifacts و پاکسازی قدیمی‌ها روی یک ترد پس‌زمینه با صف محدود انجام می‌شود.
+    - فایل‌ها در root/<bot_id>/<campaign_id>/ ذخیره می‌شوند و برای هر ربات حداکثر
+      max_per_bot فایل و حداکثر max_age_days روز نگه داشته می‌شوند.
+    """
+
+    def __init__(self, db_path, root='artifacts', max_per_class=3, window_seconds=600,
+                 max_per_bot=200, max_age_days=7, max_pending=50):
+        self.db_path = db_path
+        self.root = root
+        self.max_per_class = max_per_class
+        self.window_seconds = window_seconds
+        self.max_per_bot = max_per_bot
+        self.max_age_days = max_age_days
+        self.counters = {'captured': 0, 'written': 0, 'throttled': 0, 'dropped': 0, 'failed': 0}
+
+        self._recent = defaultdict(deque)  # (bot_id, error_class) -> زمان عکس‌های اخیر
+        self._lock = threading.Lock()
+        self._queue = Queue(maxsize=max_pending)
+        self._writer = threading.Thread(target=self._write_loop, name='artifact-writer', daemon=True)
+        self._writer.start()
+
+    def allow(self, bot_id, error_class):
+        """آیا در پنجره زمانی فعلی برای این نوع خطا هنوز عکس گرفته می‌شود؟"""
+        now = time.time()
+        with self._lock:
+            recent = self._recent[(bot_id, error_class)]
+            while recent and now - recent[0] > self.window_seconds:
+                recent.popleft()
+            if len(recent) >= self.max_per_class:
+                self.counters['throttled'] += 1
+                return False
+            recent.append(now)
+            return True
+
+    def capture(self, page, bot_id, campaign_id, error_class, username=None):
+        """گرفتن اسکرین‌شات (روی ترد مرورگر) و سپردن نوشتن آن به ترد پس‌زمینه"""
+        if page is None or not self.allow(bot_id, error_class):
+            return False
+        try:
+            # فقط viewport و با JPEG تا گرفتن عکس روی ترد مرورگر کوتاه بماند
+            data = page.screenshot(type='jpeg', quality=70, timeout=5000)
+        except Exception:
+            self.counters['failed'] += 1
+            return False
+
+        self.counters['captured'] += 1
+        try:
+            self._queue.put_nowait((bot_id, campaign_id, error_class, username, data, datetime.now()))
+        except Full:
+            self.counters['dropped'] += 1
+            return False
+        return True
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._write(*item)
+                self.counters['written'] += 1
+            except Exception as e:
+                self.counters['failed'] += 1
+                print(f"خطا در ذخیره اسکرین‌شات: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, bot_id, campaign_id, error_class, username, data, created_at):
+        directory = os.path.join(self.root, bot_id or 'no_bot', campaign_id or 'no_campaign')
+        os.makedirs(directory, exist_ok=True)
+        name = f"{created_at.strftime('%Y%m%d_%H%M%S_%f')}_{error_class}"
+        if username:
+            name += f"_{username.lstrip('@')}"
+        path = os.path.join(directory, f"{name}.jpg")
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """INSERT INTO artifacts (bot_id, campaign_id, error_class, username, path, size, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (bot_id, campaign_id, error_class, username, path, len(data),
+                 created_at.strftime('%Y-%m-%d %H:%M:%S'))
+            )
+            self._apply_retention(cursor, bot_id)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _apply_retention(self, cursor, bot_id):
+        """حذف فایل‌های بیش از max_per_bot و قدیمی‌تر از max_age_days برای این ربات"""
+        cursor.execute(
+            """SELECT id, path FROM artifacts WHERE bot_id = ?
+               AND (created_at < datetime('now', 'localtime', ?) OR id NOT IN
+                    (SELECT id FROM artifacts WHERE bot_id = ? ORDER BY id DESC LIMIT ?))""",
+            (bot_id, f'-{self.max_age_days} days', bot_id, self.max_per_bot)
+        )
+        expired = cursor.fetchall()
+        for artifact_id, path in expired:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if expired:
+            cursor.executemany("DELETE FROM artifacts WHERE id = ?", [(row[0],) for row in expired])
@@ -5,9 +5,14 @@ import re
 import time
 import json
 import unicodedata
+from collections import deque
 import pandas as pd
 from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 
+from events import LogEvent
+from resources import bot_tag
+from metrics import STEP_SECONDS
+
 # توابع کمکی
 def normalize_persian_text(text):
     if text is None: return None
@@ -18,23 +23,270 @@ def extract_usernames_from_text(text):
     if not text: return []
     return re.findall(r'@[\w\d_]+', text)
 
+def normalize_username(username):
+    """شکل یکسان نام کاربری برای مقایسه (حروف کوچک، با @)"""
+    username = str(username).strip().lower()
+    return username if username.startswith('@') else '@' + username
+
 def convert_phone_number_format(phone_number_str):
     if phone_number_str and phone_number_str.startswith('09') and len(phone_number_str) == 11 and phone_number_str.isdigit():
         return '98' + phone_number_str[1:]
     return phone_number_str
 
+def read_contacts_from_dataframe(df):
+    """استخراج نام‌های کاربری به همراه ستون‌های دیگر هر سطر (مثل نام و سازمان)
+
+    اگر سطر اول هیچ @username نداشته باشد سرستون در نظر گرفته می‌شود و مقدار بقیه
+    ستون‌های هر سطر با همان نام‌ها کنار نام کاربری نگه داشته می‌شود.
+    خروجی: دیکشنری مرتب username -> fields
+    """
+    rows = df.values.tolist()
+    header = None
+    if rows and not any(extract_usernames_from_text(str(v)) for v in rows[0] if not pd.isna(v)):
+        header = ['' if pd.isna(v) else str(v).strip() for v in rows[0]]
+        rows = rows[1:]
+
+    contacts = {}
+    for row in rows:
+        usernames = []
+        fields = {}
+        for index, value in enumerate(row):
+            if pd.isna(value):
+                continue
+            text = str(value).strip()
+            found = extract_usernames_from_text(text)
+            if found:
+                usernames.extend(found)
+            elif header and header[index]:
+                fields[header[index]] = text
+        for username in usernames:
+            contacts.setdefault(username, fields)
+    return contacts
+
+# --- روش‌های وارد کردن متن در کادر پیام (contenteditable) ---
+# fill در Playwright روی div ویرایش‌پذیر برای متن‌های طولانی کند است و گاهی خطوط
+# جدید متن فارسی را به هم می‌ریزد؛ paste و insert_text متن را در یک فراخوانی وارد می‌کنند.
+
+_PASTE_SCRIPT = """(el, text) => {
+    el.focus();
+    const data = new DataTransfer();
+    data.setData('text/plain', text);
+    el.dispatchEvent(new ClipboardEvent('paste', {clipboardData: data, bubbles: true, cancelable: true}));
+}"""
+
+_INSERT_TEXT_SCRIPT = """(el, text) => {
+    el.focus();
+    window.getSelection().selectAllChildren(el);
+    document.execCommand('insertText', false, text);
+}"""
+
+_CLEAR_SCRIPT = """(el) => {
+    el.focus();
+    window.getSelection().selectAllChildren(el);
+    document.execCommand('delete', false);
+}"""
+
+
+# تأیید ارسال با شناسه پیام (data-mid): حباب‌های قدیمی‌تری که با اسکرول بارگذاری می‌شوند
+# شناسه کوچک‌تر دارند و با حباب پیام تازه اشتباه گرفته نمی‌شوند. شناسه موقت پیام در حال
+# ارسال هم از آخرین شناسه گفتگو بزرگ‌تر است.
+# (به شکل شیء برمی‌گردد تا با wait_for_function و timeout خوانده شود؛ page.evaluate سقف زمانی ندارد)
+_LAST_OUTGOING_MID_SCRIPT = """(selector) => {
+    let last = 0;
+    document.querySelectorAll(selector).forEach(bubble => {
+        last = Math.max(last, parseFloat(bubble.dataset.mid) || 0);
+    });
+    return {last};
+}"""
+
+# وضعیت حباب خروجی با شناسه بزرگ‌تر از baseline که متنش همان پیام است:
+# sent / error / pending (با settled=true فقط وضعیت نهایی) یا null اگر هنوز نیامده
+_OUTGOING_STATE_SCRIPT = """([selector, textSelector, baseline, text, settled]) => {
+    const squash = value => (value || '').replace(/\\s+/g, '');
+    const expected = squash(text);
+    for (const bubble of document.querySelectorAll(selector)) {
+        if (!((parseFloat(bubble.dataset.mid) || 0) > baseline)) continue;
+        const body = bubble.querySelector(textSelector);
+        if (!squash(body ? body.textContent : '').includes(expected)) continue;
+        if (bubble.classList.contains('is-error')) return 'error';
+        if (bubble.classList.contains('is-sent') || bubble.classList.contains('is-read')) return 'sent';
+        if (!settled) return 'pending';
+    }
+    return null;
+}"""
+
+
+def input_by_fill(locator, text, timeout=None):
+    locator.fill(text, timeout=timeout)
+
+
+def input_by_paste(locator, text, timeout=None):
+    locator.evaluate(_PASTE_SCRIPT, text, timeout=timeout)
+
+
+def input_by_insert_text(locator, text, timeout=None):
+    locator.evaluate(_INSERT_TEXT_SCRIPT, text, timeout=timeout)
+
+
+INPUT_STRATEGIES = {
+    'paste': input_by_paste,
+    'insert_text': input_by_insert_text,
+    'fill': input_by_fill,
+}
+
+# ترتیب امتحان در حالت auto: سریع‌ترین روشی که خطوط را حفظ می‌کند اول. اجرای
+# input_benchmark.py --url ... --save روی کلاینت واقعی ترتیب اندازه‌گیری‌شده را در
+# INPUT_ORDER_FILE می‌نویسد؛ بدون آن فایل ترتیب پیش‌فرض (نتیجه صفحه تست) استفاده می‌شود.
+DEFAULT_INPUT_ORDER = ('paste', 'insert_text', 'fill')
+INPUT_ORDER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'input_order.json')
+
+
+def load_input_order(path=INPUT_ORDER_FILE):
+    """ترتیب روش‌های ورود متن از خروجی ذخیره‌شده input_benchmark (روش‌های ناشناخته نادیده گرفته می‌شوند)"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            order = json.load(f).get('order') or []
+    except (OSError, ValueError, AttributeError):
+        return DEFAULT_INPUT_ORDER
+    order = [name for name in order if name in INPUT_STRATEGIES]
+    order += [name for name in DEFAULT_INPUT_ORDER if name not in order]
+    return tuple(order)
+
+
+AUTO_INPUT_ORDER = load_input_order()
+
+
+def normalize_input_text(text):
+    """یکسان‌سازی متن برای مقایسه متن واردشده با پیام (CRLF، فاصله نشکن و خط خالی انتهایی)"""
+    return text.replace('\r\n', '\n').replace('\xa0', ' ').rstrip('\n')
+
+
+def enter_text(locator, text, strategy, timeout=None):
+    """وارد کردن متن با یک روش و بررسی اینکه محتوای کادر دقیقاً همان متن است
+
+    timeout (میلی‌ثانیه) برای هر فراخوانی Playwright؛ None یعنی timeout پیش‌فرض Playwright.
+    """
+    INPUT_STRATEGIES[strategy](locator, text, timeout=timeout)
+    return normalize_input_text(locator.inner_text(timeout=timeout)) == normalize_input_text(text)
+
+
+def clear_input(locator, timeout=None):
+    locator.evaluate(_CLEAR_SCRIPT, timeout=timeout)
+
+
+# کلیدهای localStorage وب ایتا پس از ورود (user_auth و dcN_auth_key)
+SESSION_AUTH_KEY = re.compile(r'auth', re.IGNORECASE)
+SESSION_ORIGIN = 'eitaa.com'
+
+
+def check_session_file(session_file, now=None):
+    """بررسی سریع فایل storage_state بدون راه‌اندازی مرورگر
+
+    خروجی (وضعیت، توضیح) است و وضعیت یکی از ok / missing / corrupt / no_auth / expired.
+    ok یعنی کلید احراز هویت ایتا در localStorage ذخیره شده؛ معتبر بودن نهایی نشست
+    فقط پس از باز شدن صفحه مشخص می‌شود.
+    """
+    if not os.path.exists(session_file):
+        return 'missing', 'فایل نشست وجود ندارد'
+    try:
+        with open(session_file, encoding='utf-8') as f:
+            storage = json.load(f)
+    except (OSError, ValueError) as e:
+        return 'corrupt', f'فایل نشست خوانا نیست: {e}'
+    if not isinstance(storage, dict):
+        return 'corrupt', 'ساختار فایل نشست نامعتبر است'
+
+    auth_keys = [
+        item.get('name') for origin in storage.get('origins') or []
+        if SESSION_ORIGIN in origin.get('origin', '')
+        for item in origin.get('localStorage') or []
+        if SESSION_AUTH_KEY.search(item.get('name', '')) and item.get('value')
+    ]
+    if auth_keys:
+        return 'ok', ', '.join(sorted(auth_keys))
+
+    now = now if now is not None else time.time()
+    cookies = [c for c in storage.get('cookies') or [] if SESSION_ORIGIN in c.get('domain', '')]
+    expiring = [c for c in cookies if c.get('expires', -1) > 0]
+    if expiring and all(c['expires'] < now for c in expiring):
+        return 'expired', 'همه کوکی‌های ایتا منقضی شده‌اند'
+    return 'no_auth', 'کلید احراز هویت ایتا در نشست ذخیره نشده است'
+
+
+class Deadline:
+    """بودجه زمانی کل یک ارسال؛ timeout هر مرحله از باقی‌مانده همین بودجه برداشته می‌شود"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.started = time.perf_counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def remaining(self):
+        return max(0.0, self.seconds - self.elapsed())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap_ms):
+        """timeout مرحله برای Playwright (میلی‌ثانیه): کمترینِ سقف مرحله و بودجه باقی‌مانده"""
+        remaining_ms = self.remaining() * 1000
+        if remaining_ms <= 0:
+            raise PlaywrightTimeoutError("بودجه زمانی ارسال تمام شد")
+        return max(1, min(cap_ms, remaining_ms))
+
 class EitaaBot:
-    def __init__(self, min_delay=2.0, max_delay=5.0, session_file='session.json', headless=True, log_queue=None):
+    def __init__(self, min_delay=2.0, max_delay=5.0, session_file='session.json', headless=True, log_queue=None,
+                 input_strategy='auto', confirm_timeout=8.0, send_retries=1, artifacts=None, bot_id=None,
+                 send_budget=45.0, headed_login=True):
+        if input_strategy != 'auto' and input_strategy not in INPUT_STRATEGIES:
+            raise ValueError(f"روش ورود متن نامعتبر: {input_strategy}")
         self.min_delay = min_delay
         self.max_delay = max_delay
         self.session_file = session_file
         self.headless = headless
+        # بدون نشست معتبر، کد تأیید در پنجره قابل مشاهده وارد می‌شود و پس از ذخیره نشست
+        # مرورگر برای ارسال دوباره در حالت headless باز می‌شود
+        self.headed_login = headed_login
+        self.browser_headless = None  # حالت واقعی مرورگر در حال اجرا
+        self.launched_at = None
+        self.mode_usage = {}  # 'headed' / 'headless' -> آخرین نمونه مصرف CPU و حافظه
+        self._browser_cdp = None
+        self.session_check = None  # نتیجه check_session_file پیش از راه‌اندازی مرورگر
         self.log_queue = log_queue
         self.playwright = None
         self.browser = None
         self.context = None
         self.page = None
         self.is_logged_in = False
+        self.pacing_seconds = 0.0  # مجموع زمان انتظارهای تصادفی (برای گزارش کمپین)
+        self.input_strategy = input_strategy
+        self.last_input = None  # {'strategy', 'seconds'} آخرین پیام واردشده
+        self.confirm_timeout = confirm_timeout  # حداکثر انتظار برای تأیید حباب پیام ارسالی (ثانیه)
+        self.send_retries = send_retries  # تلاش دوباره فقط وقتی پیامی از کادر خارج نشده (not_sent)
+        self.send_budget = send_budget  # حداکثر زمان کل یک ارسال (ثانیه)، بدون انتظار تصادفی بعد از آن
+        self.not_found_grace = 1.0  # فرصت رسیدن نتیجه منطبق وقتی نتایج دیگری نمایش داده شده (ثانیه)
+        # حالت pipeline: گیرنده بعدی در فاصله بین ارسال‌ها با جستجوی همین صفحه پیدا می‌شود
+        self.pipeline = False
+        self.prefetched = {}  # username -> شناسه گفتگو یا 'not_found'
+        self.pipeline_stats = {'prefetched': 0, 'hits': 0, 'fallbacks': 0}
+        # بازیافت صفحه در کمپین‌های طولانی: هر recycle_every ارسال یا وقتی heap جاوااسکریپت
+        # صفحه (هر heap_check_every ارسال از CDP خوانده می‌شود) از heap_limit_mb بیشتر شود
+        self.recycle_every = 300
+        self.heap_limit_mb = 400
+        self.heap_check_every = 25
+        self.sends_on_page = 0
+        self.recycles = 0
+        self.heap_samples = deque(maxlen=500)  # (زمان، ارسال روی صفحه فعلی، heap به مگابایت)
+        self._cdp = None
+        # نتیجه آخرین ارسال: outcome یکی از success / unconfirmed / not_sent / not_found / search_mismatch / timeout / failed / not_logged_in
+        self.last_send = None
+        # اسکرین‌شات‌های خطا (ArtifactManager)؛ campaign_id را کمپین در حال اجرا تنظیم می‌کند
+        self.artifacts = artifacts
+        self.bot_id = bot_id
+        self.campaign_id = None
         
         self.selectors = {
             'login_page': 'https://web.eitaa.com/',
@@ -44,57 +296,148 @@ class EitaaBot:
             'message_input': 'div.input-message-input[contenteditable="true"]',
             'send_button': 'button.btn-send',
             'chat_list_item': 'li.chatlist-chat',
+            # نتایج جستجو و حالت «نتیجه‌ای یافت نشد» در ستون جستجو
+            'search_result': '#search-container li.chatlist-chat',
+            # عنوان گفتگوی باز (برای بررسی باز شدن مستقیم گفتگو با شناسه در حالت pipeline)
+            'active_chat_title': 'div.chat.active .chat-info .peer-title[data-peer-id="{peer_id}"]',
+            'search_empty': '#search-container .empty-placeholder, '
+                            '#search-container :text-matches("(نتیجه|موردی).{0,3}(یافت|پیدا) نشد|No results", "i")',
             'message_bubble': 'div.bubble',
+            'outgoing_bubble': 'div.bubble.is-out[data-mid]',
             'message_text': 'div.message',
         }
 
-    def _log(self, message):
+    def _log(self, message, level='info', step=None, username=None, duration_ms=None):
+        """ثبت رویداد ساختاریافته در log_queue (صف محدود LogPipeline) یا چاپ آن"""
+        event = LogEvent(message, level=level, bot_id=self.bot_id, campaign_id=self.campaign_id,
+                         step=step, username=username, duration_ms=duration_ms)
         if self.log_queue:
-            self.log_queue.put(message)
+            self.log_queue.put(event)
         else:
-            print(message)
+            print(event.format())
+
+    def _screenshot(self, error_class, username=None):
+        """اسکرین‌شات خطا؛ با ArtifactManager محدود و در پس‌زمینه، بدون آن مثل قبل در پوشه جاری"""
+        if not self.page:
+            return
+        if self.artifacts:
+            self.artifacts.capture(self.page, self.bot_id, self.campaign_id, error_class, username)
+            return
+        name = f"{error_class}_{username.lstrip('@')}" if username else error_class
+        try:
+            self.page.screenshot(path=f'{name}.png')
+        except Exception as e:
+            self._log(f"   (هشدار) گرفتن اسکرین‌شات ناموفق بود: {e}", level='warning')
 
     def _wait_random_delay(self):
         delay = random.uniform(self.min_delay, self.max_delay)
-        self._log(f"Waiting for {delay:.2f} seconds...")
+        self._log(f"Waiting for {delay:.2f} seconds...", level='debug')
         time.sleep(delay)
+        self.pacing_seconds += delay
+
+    def _input_order(self):
+        if self.input_strategy != 'auto':
+            return (self.input_strategy,)
+        # روشی که آخرین بار موفق بوده اول امتحان می‌شود
+        preferred = self.last_input['strategy'] if self.last_input else None
+        return tuple(sorted(AUTO_INPUT_ORDER, key=lambda name: name != preferred))
+
+    def _type_message(self, message_input, message, deadline):
+        """وارد کردن پیام با روش انتخاب‌شده؛ اگر متن کادر با پیام یکی نبود روش بعدی امتحان می‌شود
+
+        همه فراخوانی‌ها از بودجه ارسال برداشته می‌شوند و با تمام شدن بودجه روش بعدی امتحان نمی‌شود.
+        """
+        clear_input(message_input, timeout=deadline.timeout(5000))  # متن باقی‌مانده از تلاش ناموفق قبلی
+        for strategy in self._input_order():
+            if deadline.expired:
+                raise PlaywrightTimeoutError("بودجه زمانی ارسال در مرحله ورود متن تمام شد")
+            started = time.perf_counter()
+            try:
+                if enter_text(message_input, message, strategy, timeout=deadline.timeout(15000)):
+                    self.last_input = {'strategy': strategy, 'seconds': time.perf_counter() - started}
+                    return strategy
+                self._log(f"   (هشدار) متن واردشده با روش {strategy} با پیام یکی نیست.", level='warning')
+            except Exception as e:
+                self._log(f"   (هشدار) ورود متن با روش {strategy} ناموفق بود: {e}", level='warning')
+            clear_input(message_input, timeout=deadline.timeout(5000))
+        raise RuntimeError("هیچ روشی متن پیام را بدون تغییر وارد نکرد")
+
+    def _submit_and_confirm(self, message_input, message, deadline):
+        """فشردن Enter و انتظار برای حباب پیام خروجی جدید با وضعیت ارسال‌شده (تیک)
+
+        شناسه آخرین حباب خروجی پیش از Enter خوانده می‌شود و فقط حبابی با شناسه بزرگ‌تر
+        که متنش همان پیام است پذیرفته می‌شود.
+        خروجی: (outcome، زمان تأیید به ثانیه)
+          success: حباب جدید تیک خورد
+          unconfirmed: حباب جدید ظاهر شد یا کادر خالی شد ولی تیک در زمان مقرر نیامد
+          not_sent: هیچ حبابی ظاهر نشد و متن در کادر ماند (یا حباب خطا گرفت)؛ ارسال دوباره امن است
+        """
+        baseline = self.page.wait_for_function(_LAST_OUTGOING_MID_SCRIPT, arg=self.selectors['outgoing_bubble'],
+                                               timeout=deadline.timeout(5000)).json_value()['last']
+        state_args = [self.selectors['outgoing_bubble'], self.selectors['message_text'], baseline,
+                      normalize_input_text(message)]
+        message_input.press('Enter', timeout=deadline.timeout(5000))
+        started = time.perf_counter()
+        deadline_ms = max(1, min(self.confirm_timeout * 1000, deadline.remaining() * 1000))
+
+        try:
+            state = self.page.wait_for_function(_OUTGOING_STATE_SCRIPT, arg=state_args + [False],
+                                                timeout=deadline_ms).json_value()
+        except PlaywrightTimeoutError:
+            try:
+                still_typed = normalize_input_text(message_input.inner_text(timeout=deadline.timeout(2000))).strip() != ''
+            except PlaywrightTimeoutError:
+                # وضعیت کادر معلوم نیست؛ برای جلوگیری از ارسال دوباره تأییدنشده حساب می‌شود
+                return 'unconfirmed', None
+            return ('not_sent' if still_typed else 'unconfirmed'), None
+
+        if state == 'pending':
+            remaining_ms = max(1, deadline_ms - (time.perf_counter() - started) * 1000)
+            try:
+                state = self.page.wait_for_function(_OUTGOING_STATE_SCRIPT, arg=state_args + [True],
+                                                    timeout=remaining_ms).json_value()
+            except PlaywrightTimeoutError:
+                return 'unconfirmed', None
+        if state == 'error':
+            return 'not_sent', None
+        return 'success', time.perf_counter() - started
 
     def login(self, phone_number=None):
         try:
-            self._log("Initializing Playwright...")
             if not self.playwright:
+                # بررسی فایل نشست پیش از راه‌اندازی Playwright؛ بدون شماره تلفن نشست نامعتبر
+                # اصلاً مرورگر باز نمی‌کند و با شماره مستقیم به ورود با کد می‌رود
+                status, detail = check_session_file(self.session_file)
+                self.session_check = status
+                self._log(f"Session pre-check: {status} ({detail})", level='debug')
+                if status != 'ok' and not phone_number:
+                    return f"session_{status}"
+                self._log("Initializing Playwright...")
                 self.playwright = sync_playwright().start()
-                self.browser = self.playwright.chromium.launch(headless=self.headless)
-                
-                storage_state = self.session_file if os.path.exists(self.session_file) else None
-                self._log(f"Loading session from: {self.session_file if storage_state else 'None'}")
-                self.context = self.browser.new_context(storage_state=storage_state)
-                self.page = self.context.new_page()
-
-                self._log(f"Navigating to {self.selectors['login_page']}...")
-                self.page.goto(self.selectors['login_page'], timeout=60000)
+                self._launch(self.headless and (status == 'ok' or not self.headed_login))
 
             self._log("Checking login status...")
-            try:
-                self.page.wait_for_selector(self.selectors['search_box'], timeout=10000)
+            if self.wait_for_login_state():
                 self.is_logged_in = True
                 self._log("Already logged in.")
                 return "already_logged_in"
-            except PlaywrightTimeoutError:
-                self._log("Not logged in. Proceeding with login flow.")
-                pass
+            self._log("Not logged in. Proceeding with login flow.")
 
             if not phone_number:
                 self._log("Phone number is required but not provided.")
                 return "phone_number_required"
 
+            if self.browser_headless and self.headed_login:
+                # نشست منقضی شده؛ کاربر باید کد را در پنجره مرورگر وارد کند
+                self.relaunch(headless=False)
+
             self._log(f"Entering phone number: {phone_number}")
             phone_input = self.page.locator(self.selectors['phone_input'])
             phone_input.wait_for(timeout=30000)
             phone_input.fill(phone_number)
             phone_input.press('Enter')
             
-            self._log("Waiting for verification code input field...")
+            self._log("Waiting for verification code input field...", level='debug')
             # ما منتظر فیلد کد می‌مانیم تا مطمئن شویم صفحه بارگذاری شده
             # اما کاربر خودش کد را وارد می‌کند
             code_input_visible = self.page.locator(self.selectors['code_input'])
@@ -104,15 +447,97 @@ class EitaaBot:
             return "waiting_for_code"
 
         except Exception as e:
-            self._log(f"ERROR during login: {e}")
-            if self.page:
-                self.page.screenshot(path='login_error.png')
+            self._log(f"ERROR during login: {e}", level='error')
+            self._screenshot('login_error')
             return f"error: {e}"
 
+    def wait_for_login_state(self, timeout_ms=30000):
+        """انتظار تا صفحه یا کادر جستجو (ورود موفق) یا کادر شماره تلفن را نشان دهد
+
+        به جای انتظار ثابت برای کادر جستجو، هر کدام زودتر ظاهر شود تعیین‌کننده است.
+        """
+        search_box = self.page.locator(self.selectors['search_box'])
+        try:
+            search_box.or_(self.page.locator(self.selectors['phone_input'])).first.wait_for(timeout=timeout_ms)
+        except PlaywrightTimeoutError:
+            return False
+        return search_box.count() > 0
+
+    def _launch(self, headless):
+        """راه‌اندازی مرورگر با نشست ذخیره‌شده (اگر وجود دارد) و باز کردن صفحه ایتا"""
+        # برچسب خط فرمان تا ResourceSampler پروسس‌های این مرورگر را به ربات نسبت دهد
+        args = [bot_tag(self.bot_id)] if self.bot_id else []
+        self.browser = self.playwright.chromium.launch(headless=headless, args=args)
+        self.browser_headless = headless
+        self.launched_at = time.time()
+        self._browser_cdp = None
+
+        storage_state = self.session_file if os.path.exists(self.session_file) else None
+        self._log(f"Loading session from: {self.session_file if storage_state else 'None'} "
+                  f"({'headless' if headless else 'headed'})")
+        self.context = self.browser.new_context(storage_state=storage_state)
+        self.page = self.context.new_page()
+        self._cdp = None
+        self.sends_on_page = 0
+
+        self._log(f"Navigating to {self.selectors['login_page']}...")
+        self.page.goto(self.selectors['login_page'], timeout=60000)
+
+    def relaunch(self, headless):
+        """بستن مرورگر فعلی و راه‌اندازی دوباره در حالت دیگر با همان نشست ذخیره‌شده"""
+        previous = self.browser_usage()
+        if previous:
+            self._log(f"مصرف مرورگر {previous['mode']}: CPU {previous['cpu_percent']}٪، "
+                      f"حافظه {previous['rss_mb'] if previous['rss_mb'] is not None else '؟'} مگابایت", step='relaunch')
+        self.is_logged_in = False
+        self.browser.close()
+        self._launch(headless)
+        self._log(f"🔁 مرورگر در حالت {'headless' if headless else 'headed'} دوباره راه‌اندازی شد.", step='relaunch')
+
+    def browser_usage(self):
+        """مصرف CPU و حافظه پروسس‌های همین مرورگر از زمان راه‌اندازی
+
+        فهرست پروسس‌ها و زمان CPU از CDP (SystemInfo.getProcessInfo) خوانده می‌شود؛
+        RSS فقط اگر psutil نصب باشد محاسبه می‌شود. نمونه در mode_usage هم نگه داشته می‌شود.
+        """
+        if not self.browser:
+            return None
+        try:
+            if self._browser_cdp is None:
+                self._browser_cdp = self.browser.new_browser_cdp_session()
+            processes = self._browser_cdp.send('SystemInfo.getProcessInfo')['processInfo']
+        except Exception as e:
+            self._log(f"خواندن مصرف مرورگر ممکن نشد: {e}", level='debug')
+            return None
+
+        cpu_seconds = sum(process.get('cpuTime', 0) for process in processes)
+        uptime = max(time.time() - self.launched_at, 0.001)
+        usage = {
+            'mode': 'headless' if self.browser_headless else 'headed',
+            'processes': len(processes),
+            'uptime_seconds': round(uptime, 1),
+            'cpu_seconds': round(cpu_seconds, 2),
+            'cpu_percent': round(100 * cpu_seconds / uptime, 1),
+            'rss_mb': None
+        }
+        try:
+            import psutil
+            rss = 0
+            for process in processes:
+                try:
+                    rss += psutil.Process(process['id']).memory_info().rss
+                except psutil.Error:
+                    pass
+            usage['rss_mb'] = round(rss / 1024 / 1024, 1)
+        except ImportError:
+            pass
+        self.mode_usage[usage['mode']] = usage
+        return usage
+
     def submit_code(self, code):
         try:
             if not self.page:
-                self._log("خطا: صفحه مرورگر مقداردهی اولیه نشده است.")
+                self._log("خطا: صفحه مرورگر مقداردهی اولیه نشده است.", level='error')
                 return "error: page_not_initialized"
 
             self._log("در حال تأیید وضعیت ورود...")
@@ -129,106 +554,344 @@ class EitaaBot:
             with open(self.session_file, 'w') as f:
                 json.dump(storage, f)
 
+            if self.headless and not self.browser_headless:
+                self.relaunch(headless=True)
+                self.page.wait_for_selector(self.selectors['search_box'], timeout=30000)
+                self.is_logged_in = True
+                self._log("✅ نشست در مرورگر headless بارگذاری شد.")
+
             return "login_successful"
 
         except PlaywrightTimeoutError:
-            self._log("❌ خطا: ورود موفقیت‌آمیز تأیید نشد. لطفاً ابتدا در پنجره مرورگر باز شده وارد شوید و سپس دکمه تأیید را بزنید.")
-            if self.page:
-                self.page.screenshot(path='submit_code_verification_error.png')
+            self._log("❌ خطا: ورود موفقیت‌آمیز تأیید نشد. لطفاً ابتدا در پنجره مرورگر باز شده وارد شوید و سپس دکمه تأیید را بزنید.", level='error')
+            self._screenshot('submit_code_verification_error')
             return "error: login_not_verified"
         except Exception as e:
-            self._log(f"❌ خطا در هنگام تأیید ورود: {e}")
-            if self.page:
-                self.page.screenshot(path='submit_code_error.png')
+            self._log(f"❌ خطا در هنگام تأیید ورود: {e}", level='error')
+            self._screenshot('submit_code_error')
             return f"error: {e}"
 
-    def send_direct_message(self, username, message):
+    def send_direct_message(self, username, message, budget_seconds=None):
+        # نتیجه ارسال قبلی نباید به این گیرنده نسبت داده شود (حتی در بازگشت زودهنگام)
+        self.last_send = {'outcome': 'not_logged_in', 'confirm_seconds': None}
         if not self.is_logged_in:
-            self._log(f"❌ عدم امکان ارسال پیام به {username}: کاربر وارد نشده است.")
+            self._log(f"❌ عدم امکان ارسال پیام به {username}: کاربر وارد نشده است.", level='error', username=username)
             return False
         
-        clean_username = username.lstrip('@')
+        self.last_send = {'outcome': 'failed', 'confirm_seconds': None}
+        self.sends_on_page += 1
+        # همه timeoutهای این ارسال از یک بودجه کل برداشته می‌شوند تا هزینه هر گیرنده محدود بماند
+        deadline = Deadline(budget_seconds or self.send_budget)
 
         try:
-            self._log(f"--- شروع ارسال پیام به {username} ---")
+            self._log(f"--- شروع ارسال پیام به {username} (بودجه {deadline.seconds:g} ثانیه) ---", level='debug', username=username)
 
-            # --- مرحله ۱: پاکسازی جستجو و جستجوی کاربر ---
+            # --- مرحله ۱ و ۲: باز کردن گفتگوی کاربر ---
+            # در حالت pipeline ممکن است گیرنده در فاصله ارسال قبلی از پیش پیدا شده باشد
+            resolved = self.prefetched.pop(normalize_username(username), None)
+            if resolved == 'not_found':
+                self.last_send = {'outcome': 'not_found', 'confirm_seconds': None}
+                self._log(f"❌ کاربر '{username}' پیدا نشد (جستجوی پیش‌از‌موعد نتیجه‌ای نداشت).", level='error', step='select', username=username)
+                return False
+            if not (resolved and self._open_chat_by_peer(resolved, username, deadline)):
+                if not self._open_chat_by_search(username, deadline):
+                    return False
+
+            # --- مرحله ۳: ارسال پیام ---
             try:
-                self._log(f"۱.۱: در حال پیدا کردن و پاک کردن کادر جستجو...")
-                search_box = self.page.locator(self.selectors['search_box'])
-                search_box.wait_for(timeout=10000)
-                search_box.click(timeout=5000)
-                search_box.fill("")
-                self.page.wait_for_timeout(500)
-
-                self._log(f"۱.۲: در حال وارد کردن نام کاربری '{username}'...")
-                search_box.fill(username)
-                self.page.wait_for_timeout(1500) # زمان انتظار برای ظاهر شدن نتایج
-                self._log("۱.۳: نام کاربری با موفقیت وارد شد.")
+                self._log("۳.۱: در حال پیدا کردن کادر ورودی پیام...", level='debug', step='send', username=username)
+                # انتخابگر دقیق‌تر برای کادر پیام که ویرایش‌پذیر است و fake نیست
+                dm_message_input_selector = 'div.input-message-input[contenteditable="true"]:not(.input-field-input-fake)'
+                message_input = self.page.locator(dm_message_input_selector)
+                message_input.wait_for(state='visible', timeout=deadline.timeout(15000))
+
+                for attempt in range(1 + self.send_retries):
+                    self._log("۳.۲: در حال نوشتن پیام...", level='debug', step='send', username=username)
+                    strategy = self._type_message(message_input, message, deadline)
+                    STEP_SECONDS.observe(self.last_input['seconds'], 'input')
+                    self._log(f"   متن با روش {strategy} در {self.last_input['seconds'] * 1000:.0f} میلی‌ثانیه وارد شد.", level='debug', step='send', username=username,
+                              duration_ms=round(self.last_input['seconds'] * 1000))
+                    self.page.wait_for_timeout(deadline.timeout(500))
+
+                    self._log(f"۳.۳: در حال فشردن کلید Enter و انتظار برای تأیید ارسال (باقی‌مانده بودجه {deadline.remaining():.1f} ثانیه)...", level='debug', step='send', username=username)
+                    outcome, confirm_seconds = self._submit_and_confirm(message_input, message, deadline)
+                    self.last_send = {'outcome': outcome, 'confirm_seconds': confirm_seconds}
+                    if outcome != 'not_sent' or attempt == self.send_retries or deadline.expired:
+                        break
+                    self._log(f"   (هشدار) پیام از کادر ارسال نشد؛ تلاش دوباره ({attempt + 1})...", level='warning', step='send', username=username)
+
+                if outcome == 'success':
+                    STEP_SECONDS.observe(confirm_seconds, 'confirm')
+                    self._log(f"✅ پیام با موفقیت برای {username} ارسال شد (تأیید در {confirm_seconds * 1000:.0f} میلی‌ثانیه).", step='confirm', username=username,
+                              duration_ms=round(confirm_seconds * 1000))
+                elif outcome == 'unconfirmed':
+                    self._log(f"⚠️ پیام برای {username} فرستاده شد ولی تأیید ارسال در زمان مقرر نیامد.", level='warning', step='confirm', username=username)
+                else:
+                    self._log(f"❌ پیام برای {username} ارسال نشد (حباب پیام ظاهر نشد).", level='error', step='confirm', username=username)
+                self._log(f"--- پایان عملیات ارسال برای {username} ({deadline.elapsed():.1f} از {deadline.seconds:g} ثانیه بودجه) ---",
+                          level='debug', username=username, duration_ms=round(deadline.elapsed() * 1000))
+                if not self.pipeline:
+                    # در حالت pipeline فاصله بین ارسال‌ها را pace_with_prefetch نگه می‌دارد
+                    self._wait_random_delay()
+                return outcome == 'success'
 
             except Exception as e:
-                self._log(f"❌ خطا در مرحله جستجوی کاربر '{username}': {e}")
-                self.page.screenshot(path=f'error_search_{clean_username}.png')
+                if deadline.expired:
+                    return self._budget_exhausted(username, deadline, 'send')
+                self._log(f"❌ خطا در مرحله ارسال پیام به '{username}': {e}", level='error', step='send', username=username)
+                self._screenshot('error_sending_message', username)
                 return False
 
-            # --- مرحله ۲: انتخاب دقیق کاربر از لیست نتایج ---
-            try:
-                self._log(f"۲.۱: در حال جستجوی '{clean_username}' در لیست نتایج...")
-                # انتخابگر دقیق‌تر برای پیدا کردن آیتم چت کاربر
-                user_item_selector = f'li.rp.chatlist-chat:has(span.peer-title:has-text("{clean_username}"))'
-                user_chat_element = self.page.locator(user_item_selector).first
-                user_chat_element.wait_for(state='attached', timeout=15000)
+        except Exception as e:
+            self._log(f"❌ خطای کلی و غیرمنتظره در تابع send_direct_message برای '{username}': {e}", level='error', username=username)
+            self._screenshot('error_general_send', username)
+            return False
 
-                self._log(f"۲.۲: '{clean_username}' در لیست پیدا شد. در حال اسکرول و کلیک...")
-                try:
-                    user_chat_element.scroll_into_view_if_needed(timeout=5000)
-                except Exception as scroll_err:
-                    self._log(f"   (هشدار جزئی) اسکرول به کاربر با خطا مواجه شد: {scroll_err}")
+    def _open_chat_by_search(self, username, deadline):
+        """مراحل ۱ و ۲ ارسال: جستجوی نام کاربری و کلیک روی نتیجه منطبق (False یعنی ارسال تمام است)"""
+        clean_username = username.lstrip('@')
 
-                user_chat_element.wait_for(state='visible', timeout=20000)
-                user_chat_element.click(timeout=10000)
-                self._log(f"۲.۳: با موفقیت روی '{clean_username}' کلیک شد.")
+        # --- مرحله ۱: پاکسازی جستجو و جستجوی کاربر ---
+        try:
+            self._log(f"۱.۱: در حال پاک کردن کادر جستجو و وارد کردن نام کاربری '{username}'...", level='debug', step='search', username=username)
+            step_started = time.perf_counter()
+            self._type_search(self.page, username, deadline)
+            STEP_SECONDS.observe(time.perf_counter() - step_started, 'search')
+            self._log(f"۱.۳: نام کاربری با موفقیت وارد شد (باقی‌مانده بودجه {deadline.remaining():.1f} ثانیه).", level='debug', step='search', username=username)
 
-            except PlaywrightTimeoutError:
-                self._log(f"❌ خطا: کاربر '{username}' پس از جستجو در لیست نتایج پیدا نشد (Timeout).")
-                self.page.screenshot(path=f'error_user_not_found_{clean_username}.png')
+        except Exception as e:
+            if deadline.expired:
+                return self._budget_exhausted(username, deadline, 'search')
+            self._log(f"❌ خطا در مرحله جستجوی کاربر '{username}': {e}", level='error', step='search', username=username)
+            self._screenshot('error_search', username)
+            return False
+
+        # --- مرحله ۲: انتخاب دقیق کاربر از لیست نتایج ---
+        try:
+            self._log(f"۲.۱: در حال جستجوی '{clean_username}' در لیست نتایج...", level='debug', step='select', username=username)
+            step_started = time.perf_counter()
+            user_chat_element = self._match_locator(self.page, username)
+            lookup = self._race_search_results(user_chat_element, deadline)
+            if lookup == 'empty':
+                # فقط حالت صریح «نتیجه‌ای یافت نشد» شکست دائمی (not_found) است
+                self.last_send = {'outcome': 'not_found', 'confirm_seconds': None}
+                self._log(f"❌ کاربر '{username}' پیدا نشد: جستجو نتیجه‌ای نداشت.", level='error', step='select', username=username,
+                          duration_ms=round(deadline.elapsed() * 1000))
                 return False
-            except Exception as e:
-                self._log(f"❌ خطا در مرحله انتخاب کاربر '{username}' از لیست: {e}")
-                self.page.screenshot(path=f'error_clicking_user_{clean_username}.png')
+            if lookup == 'mismatch':
+                # فقط گفتگوهای اخیر یا پیشنهادی دیده شد؛ شاید جستجوی سراسری کند بوده، پس قابل تلاش دوباره است
+                self.last_send = {'outcome': 'search_mismatch', 'confirm_seconds': None}
+                self._log(f"❌ نتیجه منطبق با '{username}' در {self.not_found_grace:g} ثانیه ظاهر نشد (فقط نتایج دیگر).",
+                          level='error', step='select', username=username, duration_ms=round(deadline.elapsed() * 1000))
+                self._screenshot('error_search_mismatch', username)
                 return False
 
-            # --- مرحله ۳: ارسال پیام ---
+            self._log(f"۲.۲: '{clean_username}' در لیست پیدا شد. در حال اسکرول و کلیک...", level='debug', step='select', username=username)
             try:
-                self._log("۳.۱: در حال پیدا کردن کادر ورودی پیام...")
-                # انتخابگر دقیق‌تر برای کادر پیام که ویرایش‌پذیر است و fake نیست
-                dm_message_input_selector = 'div.input-message-input[contenteditable="true"]:not(.input-field-input-fake)'
-                message_input = self.page.locator(dm_message_input_selector)
-                message_input.wait_for(state='visible', timeout=15000)
+                user_chat_element.scroll_into_view_if_needed(timeout=deadline.timeout(5000))
+            except Exception as scroll_err:
+                self._log(f"   (هشدار جزئی) اسکرول به کاربر با خطا مواجه شد: {scroll_err}", level='warning', step='select', username=username)
 
-                self._log("۳.۲: در حال نوشتن پیام...")
-                message_input.fill(message)
-                self.page.wait_for_timeout(500)
+            user_chat_element.wait_for(state='visible', timeout=deadline.timeout(20000))
+            user_chat_element.click(timeout=deadline.timeout(10000))
+            STEP_SECONDS.observe(time.perf_counter() - step_started, 'select')
+            self._log(f"۲.۳: با موفقیت روی '{clean_username}' کلیک شد (باقی‌مانده بودجه {deadline.remaining():.1f} ثانیه).", level='debug', step='select', username=username)
 
-                self._log("۳.۳: در حال فشردن کلید Enter برای ارسال...")
-                message_input.press('Enter')
-                self._log(f"✅ پیام با موفقیت برای {username} ارسال شد.")
-                self._wait_random_delay()
+        except PlaywrightTimeoutError:
+            if deadline.expired:
+                return self._budget_exhausted(username, deadline, 'select')
+            self._log(f"❌ خطا: کاربر '{username}' پس از جستجو در لیست نتایج پیدا نشد (Timeout).", level='error', step='select', username=username)
+            self._screenshot('error_user_not_found', username)
+            return False
+        except Exception as e:
+            self._log(f"❌ خطا در مرحله انتخاب کاربر '{username}' از لیست: {e}", level='error', step='select', username=username)
+            self._screenshot('error_clicking_user', username)
+            return False
 
-            except Exception as e:
-                self._log(f"❌ خطا در مرحله ارسال پیام به '{username}': {e}")
-                self.page.screenshot(path=f'error_sending_message_{clean_username}.png')
-                return False
+        return True
+
+    def _type_search(self, page, username, deadline):
+        """پاک کردن کادر جستجو و وارد کردن نام کاربری"""
+        search_box = page.locator(self.selectors['search_box'])
+        search_box.wait_for(timeout=deadline.timeout(10000))
+        search_box.click(timeout=deadline.timeout(5000))
+        search_box.fill("", timeout=deadline.timeout(5000))
+        page.wait_for_timeout(deadline.timeout(500))
+        search_box.fill(username, timeout=deadline.timeout(5000))
+        # فقط فاصله debounce جستجو؛ انتظار برای خود نتایج با مسابقه انجام می‌شود
+        page.wait_for_timeout(deadline.timeout(300))
+
+    def _match_locator(self, page, username):
+        """آیتم نتیجه جستجو که عنوانش نام کاربری را دارد (انتخابگر دقیق آیتم چت کاربر)"""
+        clean_username = username.lstrip('@')
+        return page.locator(f'li.rp.chatlist-chat:has(span.peer-title:has-text("{clean_username}"))').first
 
-            self._log(f"--- پایان عملیات ارسال برای {username} ---")
+    def _open_chat_by_peer(self, peer_id, username, deadline):
+        """باز کردن مستقیم گفتگو با شناسه‌ای که از قبل پیدا شده؛ در صورت شکست مسیر جستجو استفاده می‌شود"""
+        try:
+            self.page.evaluate("hash => { location.hash = hash; }", f"#{peer_id}")
+            title = self.page.locator(self.selectors['active_chat_title'].format(peer_id=peer_id)).first
+            title.wait_for(state='attached', timeout=deadline.timeout(5000))
+            self.pipeline_stats['hits'] += 1
+            self._log(f"۲.۳: گفتگوی '{username}' مستقیم باز شد (بدون جستجو).", level='debug', step='select', username=username)
             return True
+        except Exception as e:
+            self.pipeline_stats['fallbacks'] += 1
+            self._log(f"   (هشدار) باز کردن مستقیم گفتگوی '{username}' ناموفق بود، جستجو انجام می‌شود: {e}",
+                      level='warning', step='select', username=username)
+            return False
+
+    def prefetch_recipient(self, username, budget_seconds):
+        """پیدا کردن شناسه گفتگوی گیرنده بعدی با کادر جستجوی همین صفحه، حداکثر در budget_seconds
+
+        تب دوم باز نمی‌شود: وب‌کلاینت ایتا (مثل Telegram WebK) تک‌نمونه‌ای است و تب دیگری که
+        همان localStorage را دارد می‌تواند تب ارسال را غیرفعال کند. جستجو فقط ستون کناری را
+        عوض می‌کند و گفتگوی باز دست نمی‌خورد.
 
+        فقط نتیجه قطعی ذخیره می‌شود: شناسه گفتگو یا not_found (حالت «نتیجه‌ای یافت نشد»).
+        هر خطا یا اتمام زمان فقط یعنی ارسال بعدی مثل قبل با جستجو انجام می‌شود.
+        """
+        key = normalize_username(username)
+        if key in self.prefetched:
+            return
+        deadline = Deadline(budget_seconds)
+        try:
+            self._type_search(self.page, username, deadline)
+            match = self._match_locator(self.page, username)
+            lookup = self._race_search_results(match, deadline)
+            if lookup == 'empty':
+                self.prefetched[key] = 'not_found'
+            elif lookup == 'match':
+                peer_id = match.get_attribute('data-peer-id', timeout=deadline.timeout(1000))
+                if peer_id:
+                    self.prefetched[key] = peer_id
+            self.pipeline_stats['prefetched'] += 1
+            STEP_SECONDS.observe(deadline.elapsed(), 'prefetch')
+            self._log(f"   گیرنده بعدی '{username}' از پیش جستجو شد: {self.prefetched.get(key, lookup)}",
+                      level='debug', step='prefetch', username=username, duration_ms=round(deadline.elapsed() * 1000))
         except Exception as e:
-            self._log(f"❌ خطای کلی و غیرمنتظره در تابع send_direct_message برای '{username}': {e}")
-            if self.page:
-                self.page.screenshot(path=f'error_general_send_{clean_username}.png')
+            self._log(f"   (هشدار) جستجوی پیش‌از‌موعد '{username}' ناموفق بود: {e}",
+                      level='debug', step='prefetch', username=username)
+
+    def pace_with_prefetch(self, delay, next_username=None):
+        """فاصله بین دو ارسال؛ در حالت pipeline بخشی از آن صرف پیدا کردن گیرنده بعدی می‌شود
+
+        کل این تابع همیشه delay ثانیه طول می‌کشد تا نرخ ارسال تنظیم‌شده تغییر نکند.
+        """
+        started = time.perf_counter()
+        if self.pipeline and next_username:
+            self.prefetch_recipient(next_username, delay)
+        remaining = delay - (time.perf_counter() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def _race_search_results(self, match, deadline):
+        """انتظار هم‌زمان برای نتیجه منطبق، حالت «نتیجه‌ای یافت نشد» یا نتایج نامنطبق
+
+        خروجی: match / empty / mismatch. به جای ۱۵ ثانیه انتظار برای نتیجه منطبق، کاربر ناموجود
+        به محض نمایش حالت خالی (یا پس از not_found_grace وقتی فقط نتایج دیگر آمده) مشخص می‌شود.
+        """
+        empty = self.page.locator(self.selectors['search_empty'])
+        others = self.page.locator(self.selectors['search_result'])
+        match.or_(empty).or_(others).first.wait_for(state='attached', timeout=deadline.timeout(15000))
+
+        if match.count():
+            return 'match'
+        if empty.count():
+            return 'empty'
+        # نتایج دیگری هست؛ شاید نتیجه منطبق (جستجوی سراسری) کمی دیرتر برسد
+        try:
+            match.wait_for(state='attached', timeout=deadline.timeout(self.not_found_grace * 1000))
+            return 'match'
+        except PlaywrightTimeoutError:
+            if deadline.expired:
+                raise
+            return 'mismatch'
+
+    def heap_used_mb(self):
+        """حجم heap جاوااسکریپت صفحه اصلی از متریک‌های CDP (Performance.getMetrics)"""
+        if self._cdp is None:
+            self._cdp = self.context.new_cdp_session(self.page)
+            self._cdp.send('Performance.enable')
+        metrics = self._cdp.send('Performance.getMetrics')['metrics']
+        used = next(metric['value'] for metric in metrics if metric['name'] == 'JSHeapUsedSize')
+        return used / (1024 * 1024)
+
+    def maybe_recycle_page(self):
+        """بین دو گیرنده صدا زده می‌شود؛ اگر سیاست بازیافت برقرار باشد همان صفحه دوباره بارگذاری می‌شود"""
+        if not self.page or not self.sends_on_page:
             return False
+
+        reason = None
+        if self.sends_on_page % self.heap_check_every == 0:
+            try:
+                heap_mb = self.heap_used_mb()
+                self.heap_samples.append((time.time(), self.sends_on_page, round(heap_mb, 1)))
+                self._log(f"heap صفحه پس از {self.sends_on_page} ارسال: {heap_mb:.0f} مگابایت", level='debug', step='recycle')
+                if self.heap_limit_mb and heap_mb > self.heap_limit_mb:
+                    reason = f"heap {heap_mb:.0f} مگابایت"
+            except Exception as e:
+                self._log(f"   (هشدار) خواندن heap صفحه ناموفق بود: {e}", level='warning', step='recycle')
+        if not reason and self.recycle_every and self.sends_on_page >= self.recycle_every:
+            reason = f"{self.sends_on_page} ارسال"
+
+        if reason:
+            return self.recycle_page(reason)
+        return False
+
+    def recycle_page(self, reason=''):
+        """بارگذاری دوباره همان صفحه (نشست حفظ می‌شود) تا DOM و heap جاوااسکریپت آزاد شود
+
+        تب دوم باز نمی‌شود: وب‌کلاینت ایتا تک‌نمونه‌ای است و دو تب هم‌زمان با یک localStorage
+        می‌توانند یکی را غیرفعال کنند (همان دلیل جستجوی pipeline روی همین صفحه).
+        """
+        started = time.perf_counter()
+        if self._cdp is not None:
+            try:
+                self._cdp.detach()
+            except Exception:
+                pass
+            self._cdp = None
+        try:
+            self.page.goto(self.selectors['login_page'], timeout=60000)
+            self.page.wait_for_selector(self.selectors['search_box'], timeout=30000)
+        except Exception as e:
+            # صفحه نیمه‌بارگذاری‌شده می‌ماند؛ ارسال بعدی با انتظار برای کادر جستجو ادامه می‌دهد
+            self._log(f"   (هشدار) بازیافت صفحه ناموفق بود: {e}", level='warning', step='recycle')
+            return False
+
+        self.sends_on_page = 0
+        self.recycles += 1
+        STEP_SECONDS.observe(time.perf_counter() - started, 'recycle')
+        self._log(f"♻️ صفحه مرورگر بازیافت شد ({reason}).", step='recycle',
+                  duration_ms=round((time.perf_counter() - started) * 1000))
+        return True
+
+    def _budget_exhausted(self, username, deadline, step):
+        """پایان ارسال وقتی بودجه زمانی در میانه یک مرحله تمام شده است"""
+        self.last_send = {'outcome': 'timeout', 'confirm_seconds': None}
+        self._log(f"❌ بودجه {deadline.seconds:g} ثانیه‌ای ارسال به {username} در مرحله {step} تمام شد.",
+                  level='error', step=step, username=username, duration_ms=round(deadline.elapsed() * 1000))
+        self._screenshot('error_budget_exhausted', username)
+        return False
             
+    def suspend(self):
+        """ذخیره نشست و بستن مرورگر ربات بیکار؛ login بعدی آن را از همان نشست باز می‌کند"""
+        if not self.playwright:
+            return False
+        if self.is_logged_in and self.context:
+            storage = self.context.storage_state()
+            with open(self.session_file, 'w') as f:
+                json.dump(storage, f)
+        self.close()
+        self.playwright = self.browser = self.context = self.page = None
+        self._cdp = self._browser_cdp = None
+        self.browser_headless = None
+        self.prefetched = {}
+        self.is_logged_in = False
+        self._log("💤 مرورگر بیکار بسته شد؛ نشست ذخیره شد.")
+        return True
+
     def close(self):
         self._log("Closing browser.")
         if self.browser:
@@ -250,30 +913,30 @@ class EitaaBot:
             self._log(f"Found {len(usernames)} unique usernames.")
             return list(set(usernames))
         except Exception as e:
-            self._log(f"ERROR reading Excel file: {e}")
+            self._log(f"ERROR reading Excel file: {e}", level='error')
             return []
     
     def extract_mentions_from_group(self, group_name, message_prefix):
         if not self.is_logged_in:
-            self._log("❌ امکان استخراج نام‌های کاربری وجود ندارد، لطفاً ابتدا وارد شوید.")
+            self._log("❌ امکان استخراج نام‌های کاربری وجود ندارد، لطفاً ابتدا وارد شوید.", level='error')
             return []
 
         try:
             self._log(f"🔍 شروع عملیات برای گروه: {group_name}")
 
             # --- مرحله ۱: جستجو و باز کردن گروه ---
-            self._log("۱.۱: در حال پیدا کردن و پاک کردن کادر جستجو...")
+            self._log("۱.۱: در حال پیدا کردن و پاک کردن کادر جستجو...", level='debug')
             search_input = self.page.locator(self.selectors['search_box'])
             search_input.wait_for(timeout=10000)
             search_input.click(timeout=5000)
             search_input.fill("")
             self.page.wait_for_timeout(500)
 
-            self._log(f"۱.۲: در حال جستجوی گروه '{group_name}'...")
+            self._log(f"۱.۲: در حال جستجوی گروه '{group_name}'...", level='debug')
             search_input.fill(group_name)
             self.page.wait_for_timeout(3000)  # Wait for search results
 
-            self._log("۱.۳: در حال پیدا کردن گروه در نتایج...")
+            self._log("۱.۳: در حال پیدا کردن گروه در نتایج...", level='debug')
             group_item_selector = f'li.rp.chatlist-chat:has(span.peer-title:has-text("{group_name}"))'
             group_chat_element = self.page.locator(group_item_selector).first
             group_chat_element.wait_for(state='visible', timeout=15000)
@@ -282,29 +945,29 @@ class EitaaBot:
             self.page.wait_for_timeout(3000) # Wait for group messages to load
 
             # --- مرحله ۲: پیدا کردن پیام هدف در گروه ---
-            self._log("\n--- شروع مرحله ۲: پیدا کردن پیام هدف در گروه ---")
+            self._log("\n--- شروع مرحله ۲: پیدا کردن پیام هدف در گروه ---", level='debug')
             target_message_text = None
             try:
                 message_bubble_selector = "div.bubble"
                 message_text_in_bubble_selector = "div.message"
 
                 # اسکرول به بالا برای بارگذاری پیام‌های قدیمی‌تر
-                self._log("۲.۱: در حال اسکرول به بالای صفحه برای بارگذاری پیام‌ها...")
+                self._log("۲.۱: در حال اسکرول به بالای صفحه برای بارگذاری پیام‌ها...", level='debug')
                 chat_scrollable_area_locator = self.page.locator('//div[contains(@class, "bubbles-scroller")]/div[contains(@class, "scrollable-y")]').first
                 if chat_scrollable_area_locator.count() > 0:
                     for i in range(3):  # اسکرول چندباره برای اطمینان
-                        self._log(f"   اسکرول به بالا (تلاش {i+1}/3)...")
+                        self._log(f"   اسکرول به بالا (تلاش {i+1}/3)...", level='debug')
                         chat_scrollable_area_locator.evaluate("el => el.scrollTop = 0")
                         self.page.wait_for_timeout(2000)
 
                 # پیدا کردن همه حباب‌های پیام
                 all_message_bubbles = self.page.locator(message_bubble_selector)
                 count = all_message_bubbles.count()
-                self._log(f"۲.۲: تعداد {count} حباب پیام در گروه یافت شد. در حال بررسی از آخر...")
+                self._log(f"۲.۲: تعداد {count} حباب پیام در گروه یافت شد. در حال بررسی از آخر...", level='debug')
 
                 if count == 0:
-                     self._log("   هیچ پیامی در گروه یافت نشد. ممکن است گروه خالی باشد یا هنوز بارگذاری نشده باشد.")
-                     self.page.screenshot(path='debug_no_messages_found.png')
+                     self._log("   هیچ پیامی در گروه یافت نشد. ممکن است گروه خالی باشد یا هنوز بارگذاری نشده باشد.", level='warning')
+                     self._screenshot('debug_no_messages_found')
 
 
                 # حلقه برای پیدا کردن پیام
@@ -328,25 +991,25 @@ class EitaaBot:
                                 self._log(f"🎯 پیام هدف پیدا شد: '{target_message_text[:50]}...'")
                                 break # از حلقه خارج شو
                         except Exception as e_inner:
-                            self._log(f"   (خطای جزئی در خواندن متن پیام شماره {i}: {e_inner})")
+                            self._log(f"   (خطای جزئی در خواندن متن پیام شماره {i}: {e_inner})", level='warning')
                             pass
 
                 if not target_message_text:
-                    self._log(f"⚠️ پیام با پیشوند '{message_prefix}' در گروه '{group_name}' پیدا نشد.")
-                    self.page.screenshot(path='debug_message_not_found.png')
+                    self._log(f"⚠️ پیام با پیشوند '{message_prefix}' در گروه '{group_name}' پیدا نشد.", level='warning')
+                    self._screenshot('debug_message_not_found')
                     return [] # بازگشت لیست خالی چون پیام پیدا نشد
 
             except Exception as e_find_msg:
-                self._log(f"❌ خطایی در هنگام جستجوی پیام هدف در گروه '{group_name}' رخ داد: {e_find_msg}")
-                self.page.screenshot(path='debug_find_message_error.png')
+                self._log(f"❌ خطایی در هنگام جستجوی پیام هدف در گروه '{group_name}' رخ داد: {e_find_msg}", level='error')
+                self._screenshot('debug_find_message_error')
                 return []
 
             # --- مرحله ۳: استخراج منشن‌ها و بازگشت ---
-            self._log("\n--- شروع مرحله ۳: استخراج منشن‌ها ---")
+            self._log("\n--- شروع مرحله ۳: استخراج منشن‌ها ---", level='debug')
             if target_message_text:
                 usernames = extract_usernames_from_text(target_message_text)
                 if not usernames:
-                    self._log("⚠️ هیچ نام کاربری (@username) در پیام پیدا نشد.")
+                    self._log("⚠️ هیچ نام کاربری (@username) در پیام پیدا نشد.", level='warning')
                     return []
                 else:
                     self._log(f"✅ {len(usernames)} نام کاربری استخراج شد: {', '.join(usernames[:5])}...")
@@ -364,10 +1027,9 @@ class EitaaBot:
                 return []
 
         except Exception as e:
-            self._log(f"❌ خطای کلی و غیرمنتظره در تابع extract_mentions_from_group: {e}")
+            self._log(f"❌ خطای کلی و غیرمنتظره در تابع extract_mentions_from_group: {e}", level='error')
             import traceback
-            self._log(f"جزئیات خطا: {traceback.format_exc()}")
-            if self.page:
-                self.page.screenshot(path='debug_extract_general_error.png')
+            self._log(f"جزئیات خطا: {traceback.format_exc()}", level='debug')
+            self._screenshot('debug_extract_general_error')
             return []
             
@@ -0,0 +1,247 @@
+# backend/events.py - رویدادهای پیشرفت ارسال (SSE)، لاگ ساختاریافته و حلقه لاگ ربات‌ها
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from itertools import islice
+from queue import Queue, Full, Empty
+
+from metrics import DB_WRITE_SECONDS
+
+
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+LEVEL_NAMES = {value: name for name, value in LOG_LEVELS.items()}
+
+
+def level_value(level):
+    """عدد سطح لاگ از نام آن (نام نامعتبر = info)"""
+    return LOG_LEVELS.get(level, LOG_LEVELS['info'])
+
+
+class LogEvent:
+    """یک رویداد لاگ ساختاریافته؛ UI و گزارش‌ها بدون پارس متن روی فیلدها فیلتر می‌کنند"""
+
+    __slots__ = ('timestamp', 'level', 'bot_id', 'campaign_id', 'step', 'username', 'duration_ms', 'message')
+
+    def __init__(self, message, level='info', bot_id=None, campaign_id=None, step=None, username=None,
+                 duration_ms=None, timestamp=None):
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.level = level
+        self.bot_id = bot_id
+        self.campaign_id = campaign_id
+        self.step = step
+        self.username = username
+        self.duration_ms = duration_ms
+        self.message = message
+
+    def to_dict(self):
+        return {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.timestamp)),
+            'level': self.level,
+            'bot_id': self.bot_id,
+            'campaign_id': self.campaign_id,
+            'step': self.step,
+            'username': self.username,
+            'duration_ms': self.duration_ms,
+            'message': self.message
+        }
+
+    def format(self):
+        return f"[{time.strftime('%H:%M:%S', time.localtime(self.timestamp))}] {self.level.upper()} {self.message}"
+
+
+def format_sse(event, data):
+    """تبدیل یک رویداد به قالب متنی Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class Subscriber:
+    """صف رویدادهای یک کلاینت؛ اگر کلاینت کند باشد و صف پر شود، lagged فعال می‌شود"""
+
+    def __init__(self, max_pending):
+        self.queue = Queue(maxsize=max_pending)
+        self.lagged = False
+
+    def get(self, timeout):
+        return self.queue.get(timeout=timeout)
+
+    def drain(self):
+        """دور ریختن رویدادهای عقب‌افتاده (به جایشان یک snapshot کامل ارسال می‌شود)"""
+        self.lagged = False
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Empty:
+                return
+
+
+class ProgressBroker:
+    """پخش رویدادهای پیشرفت یک ربات بین همه کلاینت‌های متصل
+
+    publish هرگز ترد ارسال را بلاک نمی‌کند: برای کلاینتی که صفش پر است رویداد
+    دور ریخته می‌شود و کلاینت در اولین فرصت یک snapshot کامل می‌گیرد.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscriber = Subscriber(self.max_pending)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait((event, data))
+            except Full:
+                subscriber.lagged = True
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+class LogRing:
+    """حلقه لاگ فقط-افزودنی با شماره ترتیب صعودی
+
+    خواندن آن مخرب نیست؛ هر تعداد کلاینت می‌توانند با since= از آخرین شماره‌ای
+    که دیده‌اند ادامه دهند. قدیمی‌ترین خطوط پس از پر شدن ظرفیت دور ریخته می‌شوند.
+    """
+
+    def __init__(self, capacity=1000):
+        self._entries = deque(maxlen=capacity)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def put(self, message):
+        # سازگار با رابط Queue که EitaaBot برای log_queue انتظار دارد
+        self.append(message)
+
+    def append(self, event):
+        if not isinstance(event, LogEvent):
+            event = LogEvent(str(event))
+        entry = event.to_dict()
+        with self._lock:
+            self._seq += 1
+            entry['seq'] = self._seq
+            self._entries.append(entry)
+            return self._seq
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def since(self, seq=0, limit=None):
+        """خطوط با شماره بزرگ‌تر از seq؛ truncated یعنی بخشی از آن‌ها دیگر در حلقه نیست
+
+        seq بزرگ‌تر از آخرین شماره یعنی کلاینت شماره‌ای از حلقه قبلی همین ربات دارد (مثلاً پس از
+        راه‌اندازی دوباره سرور)؛ در این حالت از ابتدای حلقه خوانده و truncated برگردانده می‌شود.
+        """
+        with self._lock:
+            reset = seq > self._seq
+            if reset:
+                seq = 0
+            if not self._entries:
+                return [], reset
+            first_seq = self._entries[0]['seq']
+            truncated = reset or seq < first_seq - 1
+            start = max(0, seq - first_seq + 1)
+            entries = list(islice(self._entries, start, None))
+        if limit is not None and len(entries) > limit:
+            entries = entries[-limit:]
+            truncated = True
+        return entries, truncated
+
+    def tail(self, count):
+        with self._lock:
+            return list(self._entries)[-count:]
+
+
+class LogPipeline:
+    """صف محدود مشترک لاگ همه ربات‌ها
+
+    put هرگز بلاک نمی‌کند: رویدادهای زیر min_level همان‌جا دور ریخته می‌شوند و اگر
+    صف پر باشد رویداد شمرده و رها می‌شود. یک ترد پس‌زمینه هر رویداد را به حلقه لاگ
+    ربات خودش اضافه می‌کند و رویدادها را دسته‌ای در جدول events ذخیره می‌کند.
+    ترد با start و پس از ساخته شدن جدول events اجرا می‌شود؛ تا آن موقع رویدادها در صف می‌مانند.
+    """
+
+    def __init__(self, db_path, min_level='info', max_pending=10000, batch_size=200, flush_interval=1.0):
+        self.db_path = db_path
+        self.min_level = level_value(min_level)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = Queue(maxsize=max_pending)
+        self._rings = {}
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='log-pipeline', daemon=True)
+        self._thread.start()
+
+    def set_level(self, level):
+        self.min_level = level_value(level)
+
+    def register(self, bot_id, ring):
+        self._rings[bot_id] = ring
+
+    def unregister(self, bot_id):
+        self._rings.pop(bot_id, None)
+
+    def put(self, event):
+        if level_value(event.level) < self.min_level:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except Full:
+            self.dropped += 1
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        batch = []
+        last_flush = time.time()
+        while True:
+            try:
+                event = self._queue.get(timeout=self.flush_interval)
+                ring = self._rings.get(event.bot_id)
+                if ring is not None:
+                    ring.append(event)
+                batch.append(event)
+            except Empty:
+                pass
+            if batch and (len(batch) >= self.batch_size or time.time() - last_flush >= self.flush_interval):
+                self._persist(batch)
+                batch = []
+                last_flush = time.time()
+
+    def _persist(self, batch):
+        try:
+            started = time.perf_counter()
+            conn = sqlite3.connect(self.db_path)
+            conn.executemany(
+                """INSERT INTO events (ts, level, bot_id, campaign_id, step, username, duration_ms, message)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                [(e.timestamp, level_value(e.level), e.bot_id, e.campaign_id, e.step, e.username,
+                  e.duration_ms, e.message) for e in batch]
+            )
+            conn.commit()
+            conn.close()
+            DB_WRITE_SECONDS.observe(time.perf_counter() - started, 'events')
+        except sqlite3.Error as e:
+            print(f"خطا در ذخیره لاگ‌ها: {e}")
@@ -0,0 +1,129 @@
+# backend/input_benchmark.py - مقایسه روش‌های وارد کردن متن در کادر پیام
+"""
+هر روش ورود متن (fill، paste، insert_text) را روی یک کادر contenteditable
+شبیه کادر پیام ایتا با پیام‌های فارسی چندخطی ۱۰۰، ۱۰۰۰ و ۴۰۰۰ کاراکتری
+اجرا می‌کند و زمان میانه و اینکه خطوط جدید دقیقاً حفظ شده‌اند را گزارش می‌دهد.
+با --save ترتیب اندازه‌گیری‌شده در input_order.json نوشته می‌شود و bot_core
+ترتیب AUTO_INPUT_ORDER را از آن می‌خواند (بدون آن فایل، ترتیب پیش‌فرض صفحه تست).
+
+کادر پیام وب ایتا رویداد paste را خودش مدیریت می‌کند (متن ساده را از
+clipboardData برمی‌دارد)؛ صفحه تست همین رفتار را شبیه‌سازی می‌کند.
+
+نمونه اجرا:
+    python backend/input_benchmark.py --runs 5
+    python backend/input_benchmark.py --url https://web.eitaa.com/ --save   # روی صفحه واقعی پس از ورود
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime
+
+from playwright.sync_api import sync_playwright
+
+from bot_core import INPUT_ORDER_FILE, INPUT_STRATEGIES, clear_input, enter_text
+
+TEST_PAGE = """<!DOCTYPE html>
+<html dir="rtl"><body>
+<div class="input-message-input" contenteditable="true" style="white-space: pre-wrap"></div>
+<script>
+document.querySelector('.input-message-input').addEventListener('paste', (event) => {
+    event.preventDefault();
+    const text = event.clipboardData.getData('text/plain');
+    document.execCommand('insertText', false, text);
+});
+</script>
+</body></html>"""
+
+SAMPLE_LINE = 'سلام علی عزیز، این پیام آزمایشی از طرف سازمان نمونه است. '
+
+
+def build_message(length):
+    """پیام فارسی چندخطی با طول دقیق (بعد از هر جمله یک خط جدید)"""
+    text = ''
+    while len(text) < length:
+        text += SAMPLE_LINE.strip() + '\n'
+    return text[:length - 1].rstrip('\n') + '.'
+
+
+def run(page, selector, lengths, runs):
+    locator = page.locator(selector).first
+    results = []
+    for length in lengths:
+        message = build_message(length)
+        for name in INPUT_STRATEGIES:
+            timings = []
+            exact = True
+            for _ in range(runs):
+                clear_input(locator)
+                started = time.perf_counter()
+                try:
+                    ok = enter_text(locator, message, name)
+                except Exception:
+                    ok = False
+                timings.append((time.perf_counter() - started) * 1000)
+                exact = exact and ok
+            clear_input(locator)
+            results.append((length, name, statistics.median(timings), exact))
+    return results
+
+
+def rank(results):
+    """ترتیب روش‌ها: روش‌هایی که در همه طول‌ها متن را دقیق وارد کردند، به ترتیب جمع زمان میانه"""
+    totals = {}
+    exact = {}
+    for _, name, median, ok in results:
+        totals[name] = totals.get(name, 0.0) + median
+        exact[name] = exact.get(name, True) and ok
+    return sorted(totals, key=lambda name: (not exact[name], totals[name]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='مقایسه روش‌های ورود متن پیام')
+    parser.add_argument('--runs', type=int, default=5, help='تعداد تکرار هر اندازه')
+    parser.add_argument('--lengths', default='100,1000,4000', help='طول پیام‌ها (با کاما)')
+    parser.add_argument('--url', help='به جای صفحه تست، این آدرس باز شود (کادر پیام باید باز باشد)')
+    parser.add_argument('--selector', default='div.input-message-input[contenteditable="true"]')
+    parser.add_argument('--headed', action='store_true')
+    parser.add_argument('--save', nargs='?', const=INPUT_ORDER_FILE,
+                        help=f'ذخیره ترتیب برای حالت auto ربات (پیش‌فرض {INPUT_ORDER_FILE})')
+    args = parser.parse_args()
+    lengths = [int(value) for value in args.lengths.split(',')]
+
+    with sync_playwright() as playwright:
+        browser = playwright.chromium.launch(headless=not args.headed)
+        page = browser.new_page()
+        if args.url:
+            page.goto(args.url)
+            input("کادر پیام یک گفتگو را باز کنید و Enter بزنید...")
+        else:
+            page.set_content(TEST_PAGE)
+        results = run(page, args.selector, lengths, args.runs)
+        browser.close()
+
+    print(f"{'length':>7} {'strategy':<12} {'median ms':>10}  exact")
+    for length, name, median, exact in results:
+        print(f"{length:>7} {name:<12} {median:>10.1f}  {'yes' if exact else 'NO'}")
+
+    for length in lengths:
+        usable = [(median, name) for l, name, median, exact in results if l == length and exact]
+        best = min(usable)[1] if usable else '-'
+        print(f"سریع‌ترین روش بدون تغییر متن برای {length} کاراکتر: {best}")
+
+    order = rank(results)
+    print(f"ترتیب پیشنهادی حالت auto: {', '.join(order)}")
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'order': order,
+                'measured_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'url': args.url or 'test-page',
+                'runs': args.runs,
+                'results': [{'length': length, 'strategy': name, 'median_ms': round(median, 1), 'exact': exact}
+                            for length, name, median, exact in results]
+            }, f, ensure_ascii=False, indent=2)
+        print(f"ترتیب در {args.save} ذخیره شد (پس از راه‌اندازی دوباره سرور اعمال می‌شود)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# backend/load_test.py - تست بار: تأخیر درخواست وضعیت در حین لاگین
+"""
+یک ربات می‌سازد، درخواست لاگین را در پس‌زمینه می‌فرستد و هم‌زمان
+/api/bot/<bot_id>/status را پشت سر هم صدا می‌زند تا تأخیر پاسخ وضعیت
+در مدتی که لاگین (page.goto تا ۶۰ ثانیه) در جریان است اندازه‌گیری شود.
+
+نمونه اجرا (سرور باید از قبل بالا باشد):
+    python backend/serve.py --threads 8
+    python backend/load_test.py --phone 09123456789 --pollers 4
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.request
+
+
+def call(url, method='GET', payload=None, timeout=120):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(url, data=data, method=method,
+                                 headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return resp.status, json.loads(resp.read().decode('utf-8'))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='تست بار درخواست وضعیت در حین لاگین')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--phone', required=True, help='شماره تلفن برای شروع لاگین (09xxxxxxxxx)')
+    parser.add_argument('--pollers', type=int, default=4, help='تعداد کلاینت هم‌زمان درخواست وضعیت')
+    parser.add_argument('--interval', type=float, default=0.2, help='فاصله بین درخواست‌های هر کلاینت (ثانیه)')
+    args = parser.parse_args()
+
+    api = args.url.rstrip('/') + '/api'
+    _, created = call(f'{api}/bot/create', 'POST', {})
+    bot_id = created['bot_id']
+    print(f"ربات {bot_id} ساخته شد")
+
+    login_done = threading.Event()
+    login_result = {}
+
+    def do_login():
+        started = time.perf_counter()
+        try:
+            login_result['status'], login_result['body'] = call(
+                f'{api}/bot/{bot_id}/login', 'POST', {'phone_number': args.phone})
+        except Exception as e:
+            login_result['status'], login_result['body'] = 'error', str(e)
+        login_result['seconds'] = time.perf_counter() - started
+        login_done.set()
+
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def poll():
+        while not login_done.is_set():
+            started = time.perf_counter()
+            call(f'{api}/bot/{bot_id}/status')
+            elapsed = (time.perf_counter() - started) * 1000
+            with latencies_lock:
+                latencies.append(elapsed)
+            time.sleep(args.interval)
+
+    threading.Thread(target=do_login, daemon=True).start()
+    pollers = [threading.Thread(target=poll, daemon=True) for _ in range(args.pollers)]
+    for t in pollers:
+        t.start()
+    for t in pollers:
+        t.join()
+
+    print(f"لاگین: {login_result.get('status')} در {login_result.get('seconds', 0):.1f} ثانیه")
+    if not latencies:
+        print("هیچ درخواست وضعیتی در حین لاگین کامل نشد")
+    else:
+        print(f"درخواست‌های وضعیت در حین لاگین: {len(latencies)}")
+        print(f"  p50: {statistics.median(latencies):.1f} ms")
+        print(f"  p95: {percentile(latencies, 95):.1f} ms")
+        print(f"  max: {max(latencies):.1f} ms")
+
+    call(f'{api}/bot/{bot_id}/close', 'POST', {})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# backend/message_template.py - قالب پیام با جای‌نگهدارهای [نام] و [سازمان]
+import re
+
+# [نام] یا [نام|مقدار پیش‌فرض]
+PLACEHOLDER_PATTERN = re.compile(r'\[([^\[\]\n|]+)(?:\|([^\[\]\n]*))?\]')
+
+# فیلدهای داخلی که برای هر گیرنده همیشه وجود دارند
+USERNAME_FIELDS = ('نام_کاربری', 'username')
+
+
+class MessageTemplate:
+    """قالب پیام که یک بار برای هر کمپین کامپایل و برای هر گیرنده بدون پارس دوباره رندر می‌شود
+
+    ترتیب جست‌وجوی مقدار هر جای‌نگهدار: ستون‌های همان مخاطب، سپس متغیرهای سراسری،
+    سپس مقدار پیش‌فرض نوشته‌شده در قالب ([نام|دوست]). نامی که ستون شناخته‌شده کمپین
+    یا متغیر است ولی مقدار ندارد خالی می‌شود؛ هر [...] دیگری (مثل [اینجا کلیک کنید])
+    بدون تغییر در متن می‌ماند.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = []  # (متن ثابت، نام فیلد، مقدار پیش‌فرض یا None، متن اصلی [...])
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            literal = text[position:match.start()]
+            self.parts.append((literal, match.group(1).strip(), match.group(2), match.group(0)))
+            position = match.end()
+        self.tail = text[position:]
+        self.fields = {name for _, name, _, _ in self.parts}
+
+    @property
+    def is_static(self):
+        return not self.parts
+
+    def unresolved(self, columns=(), variables=None):
+        """نام‌هایی که برای هیچ گیرنده‌ای جایگزین نمی‌شوند و همان‌طور در متن می‌مانند"""
+        variables = variables or {}
+        return sorted({
+            name for _, name, default, _ in self.parts
+            if default is None and name not in columns and name not in variables and name not in USERNAME_FIELDS
+        })
+
+    def render(self, fields=None, variables=None, username=None, columns=()):
+        """columns: نام ستون‌های فایل مخاطبین کمپین (برای مخاطبی که آن ستون را خالی دارد)"""
+        if not self.parts:
+            return self.text
+
+        fields = fields or {}
+        variables = variables or {}
+        output = []
+        for literal, name, default, raw in self.parts:
+            output.append(literal)
+            if name in fields and fields[name] not in (None, ''):
+                output.append(str(fields[name]))
+            elif name in variables and variables[name] not in (None, ''):
+                output.append(str(variables[name]))
+            elif username and name in USERNAME_FIELDS:
+                output.append(username)
+            elif default is not None:
+                output.append(default)
+            elif name in fields or name in variables or name in columns:
+                output.append('')
+            else:
+                # کروشه معمولی متن پیام، نه جای‌نگهدار
+                output.append(raw)
+        output.append(self.tail)
+        return ''.join(output)
@@ -0,0 +1,166 @@
+# backend/metrics.py - شمارنده‌ها و هیستوگرام‌های درون‌پروسسی با خروجی متنی Prometheus
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# مرزهای پیش‌فرض هیستوگرام زمان (ثانیه)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{value}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """پایه متریک‌ها؛ با collect مقدارها هنگام scrape از یک تابع خوانده می‌شوند
+
+    collect باید دیکشنری {تاپل برچسب‌ها: مقدار} برگرداند (برای وضعیتی که جای دیگری
+    شمرده می‌شود، مثل طول صف‌ها، و نباید در مسیر اصلی دوباره شمرده شود).
+    """
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: {len(self.labelnames)} برچسب لازم است")
+        return tuple(str(label) for label in labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        if self.collect is not None:
+            values = {self._key(key): value for key, value in self.collect().items()}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+                for key, value in sorted(values.items()) if value is not None]
+
+
+class Counter(Metric):
+    """شمارنده صعودی به تفکیک برچسب‌ها"""
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """مقدار لحظه‌ای به تفکیک برچسب‌ها"""
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """هیستوگرام با مرزهای ثابت؛ observe فقط یک جست‌وجوی دودویی و چند جمع است"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # self._values: labels -> [شمار هر بازه..., شمار بزرگ‌تر از آخرین مرز, جمع]
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        lines = []
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """مجموعه متریک‌ها و تبدیل آن‌ها به قالب متنی Prometheus (نسخه 0.0.4)"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"متریک تکراری: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} collect failed: {_escape(e)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# متریک‌های مسیر ارسال که هم bot_core و هم app به‌روز می‌کنند
+SENDS = REGISTRY.register(Counter(
+    'eitaa_sends_total', 'Recipients processed, by bot and outcome.', ['bot_id', 'outcome']))
+SEND_SECONDS = REGISTRY.register(Histogram(
+    'eitaa_send_seconds', 'Browser time of one send_direct_message call, excluding random pacing.', ['bot_id']))
+STEP_SECONDS = REGISTRY.register(Histogram(
+    'eitaa_send_step_seconds', 'Latency of successful send steps (search, select, input, confirm, prefetch, recycle).',
+    ['step']))
+DB_WRITE_SECONDS = REGISTRY.register(Histogram(
+    'eitaa_db_write_seconds', 'SQLite write latency, by table.', ['table'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)))
@@ -0,0 +1,128 @@
+# backend/resources.py - مصرف حافظه و CPU سرور و مرورگر هر ربات (نمونه‌برداری در پس‌زمینه)
+import os
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # بدون psutil فقط available=False گزارش می‌شود
+    psutil = None
+
+# سوییچی که به خط فرمان Chromium هر ربات اضافه می‌شود تا پروسس‌هایش قابل تشخیص باشند
+BOT_TAG_PREFIX = '--eitaa-bot='
+
+
+def bot_tag(bot_id):
+    return f"{BOT_TAG_PREFIX}{bot_id}"
+
+
+class ResourceSampler:
+    """نمونه‌برداری دوره‌ای از درخت پروسس سرور و نسبت دادن پروسس‌های Chromium به ربات‌ها
+
+    پروسس اصلی مرورگر هر ربات با سوییچ --eitaa-bot=<bot_id> شناخته می‌شود و همه
+    فرزندانش (renderer، GPU و ...) به همان ربات نسبت داده می‌شوند. نتیجه در حافظه
+    نگه داشته می‌شود تا snapshot برای endpoint وضعیت هزینه‌ای نداشته باشد.
+    """
+
+    def __init__(self, interval=10.0):
+        self.interval = interval
+        self.available = psutil is not None
+        self._snapshot = None
+        self._processes = {}  # pid -> psutil.Process (cpu_percent به نمونه قبلی همان شیء نیاز دارد)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if not self.available or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='resource-sampler', daemon=True)
+        self._thread.start()
+
+    def snapshot(self):
+        if not self.available:
+            return {'available': False, 'reason': 'psutil نصب نیست'}
+        with self._lock:
+            if self._snapshot is None:
+                return {'available': True, 'sampled_at': None, 'bots': {}}
+            return self._snapshot
+
+    def _run(self):
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"خطا در نمونه‌برداری مصرف منابع: {e}")
+            time.sleep(self.interval)
+
+    def _process(self, pid):
+        process = self._processes.get(pid)
+        if process is None:
+            process = self._processes[pid] = psutil.Process(pid)
+            process.cpu_percent(None)  # نمونه اول همیشه ۰ است؛ از دور بعد معتبر می‌شود
+        return process
+
+    def _read(self, process):
+        with process.oneshot():
+            return process.memory_info().rss, process.cpu_percent(None)
+
+    def sample(self):
+        """یک دور نمونه‌برداری و جایگزینی snapshot"""
+        server = self._process(os.getpid())
+        children = server.children(recursive=True)
+        live = {server.pid} | {child.pid for child in children}
+        for pid in list(self._processes):
+            if pid not in live:
+                del self._processes[pid]
+
+        # پروسس اصلی مرورگر هر ربات از روی سوییچ خط فرمان
+        owners = {}
+        for child in children:
+            try:
+                for arg in child.cmdline():
+                    if arg.startswith(BOT_TAG_PREFIX):
+                        owners[child.pid] = arg[len(BOT_TAG_PREFIX):]
+                        break
+            except psutil.Error:
+                continue
+
+        bots = {}
+        other = {'processes': 0, 'rss': 0, 'cpu_percent': 0.0}
+        for child in children:
+            owner = None
+            try:
+                if child.pid in owners:
+                    owner = owners[child.pid]
+                else:
+                    for parent in child.parents():
+                        if parent.pid in owners:
+                            owner = owners[parent.pid]
+                            break
+                rss, cpu = self._read(self._process(child.pid))
+            except psutil.Error:
+                continue
+            usage = bots.setdefault(owner, {'processes': 0, 'rss': 0, 'cpu_percent': 0.0}) if owner else other
+            usage['processes'] += 1
+            usage['rss'] += rss
+            usage['cpu_percent'] += cpu
+
+        server_rss, server_cpu = self._read(server)
+        snapshot = {
+            'available': True,
+            'sampled_at': time.time(),
+            'interval': self.interval,
+            'server': {'rss_mb': _mb(server_rss), 'cpu_percent': round(server_cpu, 1)},
+            'bots': {bot_id: _summary(usage) for bot_id, usage in bots.items()},
+            'other': _summary(other),  # درایور Playwright و پروسس‌های بدون برچسب
+            'total_rss_mb': _mb(server_rss + other['rss'] + sum(usage['rss'] for usage in bots.values()))
+        }
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+
+def _mb(value):
+    return round(value / 1024 / 1024, 1)
+
+
+def _summary(usage):
+    return {'processes': usage['processes'], 'rss_mb': _mb(usage['rss']), 'cpu_percent': round(usage['cpu_percent'], 1)}
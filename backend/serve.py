@@ -0,0 +1,43 @@
+# backend/serve.py - اجرای سرور در حالت عملیاتی
+"""
+اجرای برنامه با waitress به جای سرور توسعه Flask.
+
+- reloader و debugger خاموش هستند.
+- فقط یک پروسس اجرا می‌شود (چند ترد)، چون نمونه‌های ربات و مرورگرها
+  در حافظه همین پروسس نگهداری می‌شوند؛ از gunicorn با چند worker استفاده نکنید.
+- هر جریان SSE باز (/send/stream) یک ترد را اشغال می‌کند؛ تعداد ترد را
+  بیشتر از تعداد تب‌های هم‌زمان داشبورد در نظر بگیرید.
+
+نمونه اجرا:
+    python backend/serve.py --threads 8
+    EITAA_PORT=8080 EITAA_THREADS=16 python backend/serve.py
+"""
+import argparse
+import os
+
+from waitress import serve
+
+from app import app, init_db
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='سرور عملیاتی ربات ایتا')
+    parser.add_argument('--host', default=os.environ.get('EITAA_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('EITAA_PORT', 5000)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('EITAA_THREADS', 8)),
+                        help='تعداد ترد پاسخ‌گویی به درخواست‌ها')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    init_db()
+    app.config['SERVER_PORT'] = args.port
+
+    print("🚀 سرور ربات ایتا (حالت عملیاتی) در حال راه‌اندازی...")
+    print(f"🌐 آدرس دسترسی: http://localhost:{args.port}  |  تعداد ترد: {args.threads}")
+    serve(app, host=args.host, port=args.port, threads=args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# backend/settings_service.py - تنظیمات تایپ‌شده با کش حافظه
+import json
+import sqlite3
+import threading
+
+DEFAULT_SETTINGS = {
+    'default_message': 'سلام [نام] عزیز،\nاین پیام از طرف [سازمان] است.\nبا تشکر',
+    'default_min_delay': 2.0,
+    'default_max_delay': 5.0,
+    'max_per_hour': 100,
+    'skip_recent_days': 0,
+    # متغیرهای سراسری قالب پیام، مثل {"سازمان": "..."}
+    'template_variables': {},
+    # حداقل سطح لاگ ربات‌ها: debug / info / warning / error
+    'log_level': 'info',
+    # بستن مرورگر ربات پس از این تعداد دقیقه بیکاری (۰ = هرگز)
+    'idle_minutes': 30
+}
+
+# نوع هر تنظیم؛ مقدارهای جدول settings همه متنی ذخیره می‌شوند
+SETTING_TYPES = {
+    'default_message': str,
+    'default_min_delay': float,
+    'default_max_delay': float,
+    'max_per_hour': int,
+    'skip_recent_days': int,
+    'template_variables': dict,
+    'log_level': str,
+    'idle_minutes': int
+}
+
+LOG_LEVEL_CHOICES = ('debug', 'info', 'warning', 'error')
+
+
+def parse_setting(key, value):
+    """تبدیل مقدار متنی (یا ورودی JSON) به نوع تعریف‌شده برای تنظیم"""
+    setting_type = SETTING_TYPES.get(key, str)
+    if value is None:
+        return DEFAULT_SETTINGS.get(key)
+    try:
+        if setting_type is int:
+            return int(float(value))
+        if setting_type is float:
+            return float(value)
+        if setting_type is dict:
+            parsed = json.loads(value) if isinstance(value, str) else value
+            if not isinstance(parsed, dict):
+                raise ValueError(value)
+            return parsed
+    except (TypeError, ValueError):
+        raise ValueError(f"مقدار نامعتبر برای {key}: {value}")
+    return str(value)
+
+
+def serialize_setting(value):
+    """تبدیل مقدار تایپ‌شده به متن برای ذخیره در جدول settings"""
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+class SettingsService:
+    """کش حافظه تنظیمات با نوشتن هم‌زمان در جدول settings
+
+    خواندن‌ها از حافظه انجام می‌شود؛ هر ذخیره شمارنده version را بالا می‌برد
+    و شنونده‌ها (مثلاً کمپین‌های در حال اجرا) را با کلیدهای تغییرکرده صدا می‌زند.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.version = 0
+        self._cache = None
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def _load(self):
+        settings = dict(DEFAULT_SETTINGS)
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute("SELECT key, value FROM settings")
+            for key, value in cursor.fetchall():
+                try:
+                    settings[key] = parse_setting(key, value)
+                except ValueError:
+                    pass  # مقدار خراب در دیتابیس؛ پیش‌فرض می‌ماند
+            conn.close()
+        except sqlite3.Error:
+            pass  # جدول هنوز ساخته نشده؛ پیش‌فرض‌ها
+        return settings
+
+    def all(self):
+        with self._lock:
+            if self._cache is None:
+                self._cache = self._load()
+            return dict(self._cache)
+
+    def get(self, key, default=None):
+        return self.all().get(key, default)
+
+    def update(self, values):
+        """اعتبارسنجی، ذخیره در دیتابیس و سپس به‌روزرسانی کش"""
+        parsed = {key: parse_setting(key, value) for key, value in values.items()}
+
+        with self._lock:
+            if self._cache is None:
+                self._cache = self._load()
+            merged = dict(self._cache, **parsed)
+            if merged['default_min_delay'] > merged['default_max_delay']:
+                raise ValueError("حداقل تأخیر نباید از حداکثر تأخیر بیشتر باشد")
+            if merged['max_per_hour'] < 0:
+                raise ValueError("حداکثر ارسال در ساعت نمی‌تواند منفی باشد")
+            if merged['idle_minutes'] < 0:
+                raise ValueError("زمان بیکاری نمی‌تواند منفی باشد")
+            if merged['log_level'] not in LOG_LEVEL_CHOICES:
+                raise ValueError(f"سطح لاگ نامعتبر: {merged['log_level']}")
+
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            for key, value in parsed.items():
+                cursor.execute(
+                    "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                    (key, serialize_setting(value))
+                )
+            conn.commit()
+            conn.close()
+
+            changed = {key: value for key, value in parsed.items() if self._cache.get(key) != value}
+            self._cache = merged
+            self.version += 1
+            version = self.version
+            listeners = list(self._listeners)
+
+        if changed:
+            for listener in listeners:
+                listener(changed, version)
+        return merged
+
+    def subscribe(self, listener):
+        """ثبت تابعی که پس از هر تغییر با (changed, version) صدا زده می‌شود"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def invalidate(self):
+        with self._lock:
+            self._cache = None
@@ -230,45 +230,41 @@ async function uploadExcelFile(file) {
     }
 }
 
-// بروزرسانی وضعیت ارسال
+// بروزرسانی وضعیت ارسال (SSE)
+let statusStream = null;
+
 function startStatusUpdates() {
-    const updateInterval = setInterval(async () => {
-        if (!isSending) {
-            clearInterval(updateInterval);
-            return;
-        }
+    if (statusStream) statusStream.close();
+    statusStream = new EventSource(`${API_BASE_URL}/bot/${currentBotId}/send/stream`);
+    
+    const applyStats = (stats) => {
+        sendStats = { total: stats.total, sent: stats.sent, success: stats.success, error: stats.error };
+        const progress = sendStats.total > 0 ? Math.round((sendStats.sent / sendStats.total) * 100) : 0;
+        updateProgress(progress);
+    };
+    
+    const finish = () => {
+        isSending = false;
+        statusStream.close();
+        statusStream = null;
+        document.getElementById('stopBtn').disabled = true;
+        document.getElementById('sendBtn').disabled = false;
         
-        try {
-            // در اینجا می‌توانید وضعیت ارسال را از سرور بگیرید
-            // فعلاً شبیه‌سازی می‌کنیم
-            if (sendStats.sent < sendStats.total) {
-                sendStats.sent += Math.floor(Math.random() * 3) + 1;
-                sendStats.success += Math.floor(Math.random() * 2) + 1;
-                sendStats.error = sendStats.sent - sendStats.success;
-                
-                if (sendStats.sent > sendStats.total) {
-                    sendStats.sent = sendStats.total;
-                }
-                
-                const progress = Math.round((sendStats.sent / sendStats.total) * 100);
-                updateProgress(progress);
-                
-                // افزودن به لاگ
-                addToLog(`ارسال ${sendStats.sent} از ${sendStats.total} (${sendStats.success} موفق)`);
-            } else {
-                // پایان ارسال
-                isSending = false;
-                clearInterval(updateInterval);
-                document.getElementById('stopBtn').disabled = true;
-                document.getElementById('sendBtn').disabled = false;
-                
-                showNotification('ارسال کامل شد', 'success');
-                addToLog('✅ ارسال کامل شد');
-            }
-        } catch (error) {
-            console.error('خطا در بروزرسانی وضعیت:', error);
-        }
-    }, 2000);
+        showNotification('ارسال کامل شد', 'success');
+        addToLog('✅ ارسال کامل شد');
+    };
+    
+    statusStream.addEventListener('snapshot', (e) => {
+        const stats = JSON.parse(e.data);
+        applyStats(stats);
+        if (!stats.is_running) finish();
+    });
+    statusStream.addEventListener('progress', (e) => applyStats(JSON.parse(e.data)));
+    statusStream.addEventListener('log', (e) => addToLog(JSON.parse(e.data).message));
+    statusStream.addEventListener('done', (e) => {
+        applyStats(JSON.parse(e.data));
+        finish();
+    });
 }
 
 // توقف ارسال
@@ -276,6 +272,11 @@ async function stopSending() {
     if (!currentBotId) return;
     
     if (confirm('آیا می‌خواهید ارسال را متوقف کنید؟')) {
+        await fetch(`${API_BASE_URL}/bot/${currentBotId}/send/stop`, { method: 'POST' }).catch(console.error);
+        if (statusStream) {
+            statusStream.close();
+            statusStream = null;
+        }
         isSending = false;
         document.getElementById('stopBtn').disabled = true;
         document.getElementById('sendBtn').disabled = false;
@@ -15,10 +15,10 @@ if errorlevel 1 (
 )
 
 echo 📦 بررسی پکیج‌ها...
-python -c "import flask" 2>nul
+python -c "import flask, waitress" 2>nul
 if errorlevel 1 (
-    echo ⚠️ Flask نصب نیست. در حال نصب...
-    pip install flask flask-cors
+    echo ⚠️ پکیج‌ها نصب نیستند. در حال نصب...
+    pip install -r requirements.txt
 )
 
 echo.
@@ -29,6 +29,6 @@ echo.
 echo ⚠️  این پنجره را نبندید!
 echo.
 
-python backend\app.py
+python backend\serve.py
 
 pause
\ No newline at end of file
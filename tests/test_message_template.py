@@ -0,0 +1,23 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from message_template import MessageTemplate
+
+
+def test_brackets_outside_placeholders_are_kept():
+    template = MessageTemplate('سلام [نام] عزیز، لینک: [اینجا کلیک کنید] و [1]')
+    assert template.render({}, {}, '@u') == 'سلام [نام] عزیز، لینک: [اینجا کلیک کنید] و [1]'
+    assert template.unresolved() == ['1', 'اینجا کلیک کنید', 'نام']
+
+
+def test_known_names_are_substituted():
+    template = MessageTemplate('سلام [نام] از [سازمان]، [کد|بدون کد] [اینجا کلیک کنید]')
+    rendered = template.render({'نام': 'علی'}, {'سازمان': 'شرکت'}, '@u')
+    assert rendered == 'سلام علی از شرکت، بدون کد [اینجا کلیک کنید]'
+
+
+def test_known_column_without_value_renders_empty():
+    template = MessageTemplate('سلام [نام] عزیز [username]')
+    assert template.render({}, {}, '@u', columns={'نام'}) == 'سلام  عزیز @u'